@@ -2,22 +2,23 @@
 
 # --- 1. Standard & 3rd Party Libraries ---
 import streamlit as st
-import streamlit_authenticator as stauth
 import bcrypt
 import random
 import json
 import os
+import uuid
 from dotenv import load_dotenv
 from streamlit_quill import st_quill
 from streamlit_modal import Modal
 
 # --- 2. Custom Modules ---
+import json_utils
 from gemini_handler import (
-    generate_explanation, generate_modified_question, analyze_difficulty, get_chat_response, generate_session_title
+    generate_explanation, generate_explanations_batch, generate_modified_question, analyze_difficulty_batch, get_chat_response, generate_session_title
 )
 # db_utils는 함수 단위로 명시적으로 임포트하여 가독성 및 안정성 향상
 from db_utils import (
-    setup_database_tables, load_original_questions_from_json, get_db_connection,
+    setup_database_tables, load_original_questions_from_json, delete_all_user_answers,
     get_all_question_ids, get_question_by_id, add_new_original_question, update_original_question,
     get_wrong_answers, delete_wrong_answer, get_all_modified_questions, save_modified_question,
     delete_modified_question, clear_all_modified_questions, get_stats, get_top_5_missed,
@@ -27,9 +28,10 @@ from db_utils import (
     get_all_explanations_for_admin, get_chat_history, save_chat_message,
     get_chat_sessions, delete_chat_session,
     update_chat_session_title, get_full_chat_history, update_chat_message, delete_chat_message_and_following,
-    delete_single_chat_message, delete_chat_messages_from, delete_single_original_question
+    delete_single_chat_message, delete_chat_messages_from, delete_single_original_question,
+    get_cached_difficulties, save_cached_difficulties
 )
-from ui_components import display_question, display_results
+from ui_components import inject_css, media_exists, display_question, display_results
 
 # --- Constants ---
 load_dotenv()
@@ -46,10 +48,11 @@ if not MASTER_ACCOUNT_PASSWORD:
     st.stop() # 앱 실행을 중지
 
 # --- Helper Functions ---
-def get_ai_explanation(q_id, q_type):
+def get_ai_explanation(q_id, q_type, on_partial=None):
     """
     AI 해설을 가져옵니다. DB에 저장된 해설이 있으면 그것을 반환하고,
     없으면 새로 생성하여 DB에 저장한 후 반환합니다.
+    on_partial은 새로 생성할 때 스트리밍 중간 결과를 받을 콜백입니다. (generate_explanation 참고)
     """
     # 1. DB에서 먼저 찾아보기
     explanation = get_ai_explanation_from_db(q_id, q_type)
@@ -63,14 +66,44 @@ def get_ai_explanation(q_id, q_type):
     if not question_data:
         return {"error": f"DB에서 문제(ID: {q_id}, Type: {q_type})를 찾을 수 없습니다."}
     
-    new_explanation = generate_explanation(question_data)
+    new_explanation = generate_explanation(question_data, on_partial=on_partial)
     
     # 3. 생성된 해설을 DB에 저장 (오류가 아닌 경우에만)
     if "error" not in new_explanation:
-        save_ai_explanation(q_id, q_type, json.dumps(new_explanation))
+        save_ai_explanation(q_id, q_type, json_utils.dumps(new_explanation))
         
     return new_explanation
 
+def get_ai_explanations_batch(q_infos):
+    """
+    여러 문제의 AI 해설을 한꺼번에 준비합니다. DB에 없는 것만 모아 동시에 생성하고 저장합니다.
+    생성에 실패한 문제 수를 반환합니다.
+    """
+    missing = []
+    for q_info in q_infos:
+        if get_ai_explanation_from_db(q_info['id'], q_info['type']):
+            continue
+        question_data = get_question_by_id(q_info['id'], q_info['type'])
+        if question_data:
+            missing.append((q_info, question_data))
+    if not missing:
+        return 0
+
+    progress_bar = st.progress(0, text="AI 해설 생성 중...")
+    explanations = generate_explanations_batch(
+        [question_data for _, question_data in missing],
+        on_progress=lambda done, total: progress_bar.progress(done / total, text=f"AI 해설 생성 중... ({done}/{total})")
+    )
+    progress_bar.empty()
+
+    failed = 0
+    for (q_info, _), explanation in zip(missing, explanations):
+        if "error" in explanation:
+            failed += 1
+        else:
+            save_ai_explanation(q_info['id'], q_info['type'], json_utils.dumps(explanation))
+    return failed
+
 def initialize_session_state():
     defaults = {
         'current_view': 'home', 'questions_to_solve': [], 'current_question_index': 0,
@@ -78,7 +111,7 @@ def initialize_session_state():
         'temp_new_question': "", 'temp_new_options': {}
     }
     for key, value in defaults.items():
-        if key not in st.session_state: st.session_state[key] = value
+        st.session_state.setdefault(key, value)
 
 def start_quiz_session(quiz_mode, quiz_type=None, num_questions=None, question_id=None, difficulty=None):
     st.session_state.questions_to_solve = []
@@ -140,6 +173,15 @@ def render_home_page():
                 st.markdown(f"**미리보기 (ID: {p_q['id']})**"); st.markdown(p_q['question'], unsafe_allow_html=True)
         if st.button(f"ID {q_id} 풀기", type="primary"): start_quiz_session(quiz_mode, question_id=q_id)
 
+def _move_question(offset):
+    st.session_state.current_question_index += offset
+
+def _open_results():
+    # 이전 퀴즈의 채점 결과를 비워 결과 화면에서 이번 퀴즈를 새로 채점하게 함
+    st.session_state.pop('graded_results', None)
+    st.session_state.pop('shown_explanations', None)
+    st.session_state.current_view = 'results'
+
 def render_quiz_page():
     if not st.session_state.questions_to_solve:
         st.warning("풀 문제가 없습니다. 홈으로 돌아가 퀴즈를 다시 시작해주세요.")
@@ -147,16 +189,17 @@ def render_quiz_page():
         return
     idx, total = st.session_state.current_question_index, len(st.session_state.questions_to_solve)
     st.progress((idx + 1) / total, text=f"{idx + 1}/{total} 문제 진행 중...")
-    if idx not in st.session_state.user_answers: st.session_state.user_answers[idx] = []
+    st.session_state.user_answers.setdefault(idx, set())
     q_info = st.session_state.questions_to_solve[idx]
     if question := get_question_by_id(q_info['id'], q_info['type']):
         display_question(question, idx, total)
         c1, _, c2 = st.columns([1, 3, 1])
-        if c1.button("이전", disabled=(idx == 0), use_container_width=True): st.session_state.current_question_index -= 1; st.rerun()
+        # 상태 변경은 on_click 콜백에서 처리하여, 클릭으로 인한 rerun 한 번에 바로 새 화면이 그려지게 함 (st.rerun() 불필요)
+        c1.button("이전", disabled=(idx == 0), use_container_width=True, on_click=_move_question, args=(-1,))
         if idx < total - 1:
-            if c2.button("다음", use_container_width=True): st.session_state.current_question_index += 1; st.rerun()
+            c2.button("다음", use_container_width=True, on_click=_move_question, args=(1,))
         else:
-            if c2.button("결과 보기", type="primary", use_container_width=True): st.session_state.current_view = 'results'; st.rerun()
+            c2.button("결과 보기", type="primary", use_container_width=True, on_click=_open_results)
     else: st.error(f"문제(ID: {q_info['id']})를 불러오는 데 실패했습니다.")
 
 def render_notes_page(username):
@@ -210,7 +253,7 @@ def render_notes_page(username):
             # 미디어 표시 (경로 존재 확인)
             media_url = question.get('media_url')
             media_type = question.get('media_type')
-            if media_url and os.path.exists(media_url):
+            if media_url and media_exists(media_url):
                 if media_type == 'image':
                     st.image(media_url)
                 else:
@@ -218,7 +261,7 @@ def render_notes_page(username):
             
             # 선택지 출력
             try:
-                options = json.loads(question.get('options') or "{}")
+                options = json_utils.loads(question.get('options') or "{}")
                 st.markdown("**선택지:**")
                 for key, value in options.items():
                     st.write(f" - **{key}:** {value}")
@@ -227,7 +270,7 @@ def render_notes_page(username):
             
             # 정답 출력
             try:
-                answer = json.loads(question.get('answer') or "[]")
+                answer = json_utils.loads(question.get('answer') or "[]")
                 if isinstance(answer, list):
                     st.error(f"**정답:** {', '.join(answer)}")
                 else:
@@ -245,7 +288,7 @@ def render_notes_page(username):
                             st.info(f"**💡 쉬운 비유:**\n{exp.get('analogy', 'N/A')}")
                             st.info(f"**🔑 핵심 개념:**\n{exp.get('core_concepts', 'N/A')}")
 def render_results_page(username):
-    display_results(username, get_ai_explanation)
+    display_results(username, get_ai_explanation, get_ai_explanations_batch)
     if st.button("새 퀴즈 시작"): st.session_state.current_view = 'home'; st.rerun()
 
 def render_management_page(username):
@@ -343,11 +386,23 @@ def render_management_page(username):
                     questions_to_load = []
                     if analyze_option:
                         progress_bar = st.progress(0, text="AI 난이도 분석 시작...")
-                        total = len(questions_from_json)
-                        for i, q in enumerate(questions_from_json):
-                            q['difficulty'] = analyze_difficulty(q['question'])
+                        # 이전에 분석한 적 있는 문제는 캐시된 난이도를 쓰고, 처음 보는 문제만 API로 분석
+                        difficulties = get_cached_difficulties(q['question'] for q in questions_from_json)
+                        to_analyze = [text for text in dict.fromkeys(q['question'] for q in questions_from_json) if text not in difficulties]
+                        if to_analyze:
+                            # 문제별 API 호출을 동시에 보내고, 끝나는 대로 진행률을 갱신
+                            results = analyze_difficulty_batch(
+                                to_analyze,
+                                on_progress=lambda done, total: progress_bar.progress(done / total, text=f"AI 분석 중... ({done}/{total})"),
+                                default=None
+                            )
+                            # 분석에 실패한 문제는 캐시하지 않아 다음 번에 다시 시도되도록 함
+                            new_difficulties = {text: result for text, result in zip(to_analyze, results) if result}
+                            save_cached_difficulties(new_difficulties)
+                            difficulties.update(new_difficulties)
+                        for q in questions_from_json:
+                            q['difficulty'] = difficulties.get(q['question'], '보통')
                             questions_to_load.append(q)
-                            progress_bar.progress((i + 1) / total, text=f"AI 분석 중... ({i+1}/{total})")
                         progress_bar.empty()
                         st.toast("AI 분석 완료! DB에 저장합니다.", icon="🤖")
                     else:
@@ -421,6 +476,7 @@ def render_management_page(username):
                     if uploaded_file:
                         file_path = os.path.join(MEDIA_DIR, uploaded_file.name)
                         with open(file_path, "wb") as f: f.write(uploaded_file.getbuffer())
+                        media_exists.clear()
                         media_url, media_type = file_path, 'image' if uploaded_file.type.startswith('image') else 'video'
 
                     final_options = {k: v for k, v in st.session_state.temp_new_options.items() if k in valid_options}
@@ -485,8 +541,8 @@ def render_management_page(username):
 
                 with st.form(key=f"edit_form_{edit_id}"):
                     st.markdown(f"**ID {edit_id} 수정:**")
-                    curr_opts = json.loads(q_data['options'])
-                    curr_ans = json.loads(q_data['answer'])
+                    curr_opts = json_utils.loads(q_data['options'])
+                    curr_ans = json_utils.loads(q_data['answer'])
                     edited_q = st_quill(value=q_data['question'] or "", html=True, key=f"q_{edit_id}")
                     
                     if q_data.get('media_url'): st.write(f"현재 미디어: {os.path.basename(q_data['media_url'])}")
@@ -583,8 +639,8 @@ def render_management_page(username):
                         with st.expander(f"**ID {q_id} ({q_type})** | {preview}"):
                             st.markdown(question.get('question') or "", unsafe_allow_html=True)
                             try:
-                                options = json.loads(question.get('options') or "{}")
-                                answer = json.loads(question.get('answer') or "[]")
+                                options = json_utils.loads(question.get('options') or "{}")
+                                answer = json_utils.loads(question.get('answer') or "[]")
                                 st.write("**선택지:**")
                                 for key, value in options.items():
                                     st.write(f" - **{key}:** {value}")
@@ -640,8 +696,8 @@ def render_management_page(username):
                         with st.expander(f"**ID {mq['id']}** | {preview}"):
                             st.markdown(mq['question'], unsafe_allow_html=True)
                             try:
-                                options = json.loads(mq['options'])
-                                answer = json.loads(mq['answer'])
+                                options = json_utils.loads(mq['options'])
+                                answer = json_utils.loads(mq['answer'])
                                 st.write("**선택지:**")
                                 for key, value in options.items():
                                     st.write(f" - **{key}:** {value}")
@@ -713,10 +769,10 @@ def render_analytics_page(username):
     c3.metric("정답률", f"{accuracy:.1f}%")
     st.write("---")
     st.subheader("자주 틀리는 문제 Top 5")
-    df = get_top_5_missed(username)
-    if df.empty: st.info("데이터가 부족합니다.")
+    top_missed = get_top_5_missed(username)
+    if not top_missed: st.info("데이터가 부족합니다.")
     else:
-        for _, row in df.iterrows():
+        for row in top_missed:
             with st.container(border=True):
                 st.write(f"**{row['wrong_count']}회 오답** (ID: {row['id']})")
                 st.markdown(row['question'], unsafe_allow_html=True)
@@ -740,7 +796,6 @@ def render_ai_tutor_page(username):
         st.subheader("대화 기록")
         
         if st.button("새 대화 시작 ➕", use_container_width=True):
-            import uuid
             # 새 ID를 생성하고 즉시 현재 세션으로 설정
             st.session_state.chat_session_id = f"session_{uuid.uuid4()}"
             st.session_state.editing_message_id = None
@@ -899,7 +954,6 @@ def render_ai_tutor_page(username):
         # 3. AI 호출
         with st.spinner("AI가 수정된 질문에 대한 답변을 생성 중입니다..."):
             current_history = get_chat_history(username, session_id)
-            from gemini_handler import get_chat_response
             response = get_chat_response(current_history, edited_content)
             save_chat_message(username, session_id, "model", response)
             
@@ -918,7 +972,6 @@ def render_ai_tutor_page(username):
             # 2. AI 호출
             with st.spinner("AI가 답변을 생각 중입니다..."):
                 current_history = get_chat_history(username, session_id)
-                from gemini_handler import get_chat_response
                 response = get_chat_response(current_history, prompt)
                 save_chat_message(username, session_id, "model", response)
             
@@ -966,10 +1019,7 @@ def run_main_app(authenticator, all_user_info):
         with st.expander("⚠️ 전체 데이터 초기화"):
             st.warning("로그인한 사용자의 모든 오답 기록과 (관리자인 경우) AI 변형 문제를 영구적으로 삭제합니다.")
             if st.button("모든 학습 기록 삭제", type="primary", use_container_width=True):
-                conn = get_db_connection()
-                conn.execute("DELETE FROM user_answers WHERE username = ?", (username,))
-                conn.commit()
-                conn.close()
+                delete_all_user_answers(username)
                 if st.session_state.is_admin:
                     clear_all_modified_questions()
                     st.toast("모든 AI 변형 문제가 삭제되었습니다.", icon="💥")
@@ -994,6 +1044,7 @@ def run_main_app(authenticator, all_user_info):
 def main():
     """메인 실행 함수: 앱의 시작점"""
     st.set_page_config(page_title="Oracle OCP AI 튜터", layout="wide", initial_sidebar_state="expanded")
+    inject_css()
 
     # --- 1. 데이터베이스 및 마스터 계정 설정 ---
     if 'db_setup_done' not in st.session_state:
@@ -1023,7 +1074,8 @@ def main():
         login_pw = st.text_input("비밀번호", type="password", key="login_password")
         if st.button("로그인"):
             user = all_user_info.get(login_user)
-            if user and user.get("password") and bcrypt.checkpw(login_pw.encode(), user["password"].encode()):
+            stored_pw = credentials["usernames"].get(login_user, {}).get("password")
+            if user and stored_pw and bcrypt.checkpw(login_pw.encode(), stored_pw.encode()):
                 st.session_state.authentication_status = True
                 st.session_state.username = login_user
                 st.session_state.name = user.get("name", login_user)
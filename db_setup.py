@@ -57,16 +57,13 @@ def load_questions_from_json(cursor, json_path):
     cursor.execute("DELETE FROM original_questions")
     print("기존 원본 문제 데이터를 삭제했습니다.")
 
-    for q in questions:
-        # 딕셔너리 형태의 options와 answer를 JSON 문자열로 변환하여 저장
-        options_str = json.dumps(q['options'])
-        answer_str = json.dumps(q['answer'])
-
-        # 파라미터화된 쿼리를 사용하여 SQL 인젝션 방지
-        cursor.execute(
-            "INSERT INTO original_questions (id, question, options, answer) VALUES (?, ?, ?, ?)",
-            (q['id'], q['question'], options_str, answer_str)
-        )
+    # 딕셔너리 형태의 options와 answer를 JSON 문자열로 변환하여 한 번의 executemany로 저장
+    # (호출부에서 마지막에 한 번만 commit하므로 전체가 하나의 트랜잭션으로 처리됨)
+    # 파라미터화된 쿼리를 사용하여 SQL 인젝션 방지
+    cursor.executemany(
+        "INSERT INTO original_questions (id, question, options, answer) VALUES (?, ?, ?, ?)",
+        [(q['id'], q['question'], json.dumps(q['options']), json.dumps(q['answer'])) for q in questions]
+    )
     
     print(f"'{json_path}' 파일로부터 총 {len(questions)}개의 문제를 DB에 삽입했습니다.")
 
@@ -6,549 +6,869 @@
 """
 # --- Python Standard Libraries ---
 import sqlite3
-import json
-
-# --- 3rd Party Libraries ---
-import pandas as pd
+import threading
+import functools
+import queue
+import contextlib
+import atexit
+import datetime
+import hashlib
+import itertools
+
+# --- Custom Modules ---
+from json_utils import dumps as _dumps, loads as _loads
 
 # --- 상수 정의 ---
 DB_NAME = 'ocp_quiz.db'
+# 테이블/컬럼/인덱스를 바꾸면 함께 올려야 setup_database_tables가 다시 실행됨
+SCHEMA_VERSION = 5
+# 대량 적재 시 executemany 한 번에 넘길 문제 수
+LOAD_CHUNK_SIZE = 1000
+# 연결별 준비된 구문 캐시 크기 (이 모듈의 서로 다른 SQL 개수보다 넉넉하게)
+STATEMENT_CACHE_SIZE = 128
+# 이 횟수만큼 연결을 빌려 줄 때마다 반납되는 연결에서 PRAGMA optimize 실행
+OPTIMIZE_EVERY_BORROWS = 1000
+
+# --- 자주 실행되는 SQL ---
+# 같은 문자열 객체를 재사용해야 연결별 statement cache(기본 128개)에서 준비된 구문을 다시 씀
+_SAVE_ANSWER_SQL = "INSERT INTO user_answers (username, question_id, question_type, user_choice, is_correct, solved_at) VALUES (?, ?, ?, ?, ?, ?)"
+_CHAT_SESSION_EXISTS_SQL = "SELECT COUNT(*) FROM chat_history WHERE session_id = ?"
+_SAVE_CHAT_SQL = "INSERT INTO chat_history (username, session_id, role, content) VALUES (?, ?, ?, ?)"
+_SAVE_CHAT_WITH_TITLE_SQL = "INSERT INTO chat_history (username, session_id, session_title, role, content) VALUES (?, ?, ?, ?, ?)"
+_GET_ORIGINAL_QUESTION_SQL = "SELECT id, question, options, answer, media_url, media_type, difficulty FROM original_questions WHERE id = ?"
+_GET_MODIFIED_QUESTION_SQL = "SELECT id, original_id, question, options, answer FROM modified_questions WHERE id = ?"
+_GET_ORIGINAL_QUESTIONS_SQL = "SELECT id, question, options, answer, media_url, media_type, difficulty FROM original_questions WHERE id IN (SELECT value FROM json_each(?))"
+_GET_MODIFIED_QUESTIONS_SQL = "SELECT id, original_id, question, options, answer FROM modified_questions WHERE id IN (SELECT value FROM json_each(?))"
+_UPSERT_ORIGINAL_QUESTION_SQL = """INSERT INTO original_questions (id, question, options, answer, difficulty, media_url, media_type) VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(id) DO UPDATE SET
+    question=excluded.question, options=excluded.options, answer=excluded.answer,
+    difficulty=excluded.difficulty, media_url=excluded.media_url, media_type=excluded.media_type"""
+_CHAT_HISTORY_SQL = "SELECT role, content FROM chat_history WHERE username = ? AND session_id = ? ORDER BY timestamp ASC"
+
+# --- JSON 디코딩 캐시 ---
+# 디코딩된 options/answer를 (컬럼, 문제 ID)별로 보관 (문제 변경 시 _invalidate_question_cache()에서 비움)
+# 캐시된 객체를 그대로 돌려주므로 호출자는 결과를 수정하지 않아야 합니다.
+_JSON_CACHE = {}
+
+def _cached_json_loads(column, q_id, raw, default_factory):
+    """같은 문제의 JSON 컬럼을 매번 다시 파싱하지 않도록 캐시를 거쳐 디코딩합니다."""
+    key = (column, q_id)
+    if key not in _JSON_CACHE:
+        try: _JSON_CACHE[key] = _loads(raw)
+        except (ValueError, TypeError): _JSON_CACHE[key] = default_factory()
+    return _JSON_CACHE[key]
 
 # --- 데이터베이스 연결 ---
-def get_db_connection():
-    """데이터베이스 연결 객체를 생성하고 반환합니다."""
-    conn = sqlite3.connect(DB_NAME, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+class ConnectionPool:
+    """
+    sqlite3 연결을 재사용하기 위한 스레드 안전한 연결 풀.
+    Streamlit은 rerun마다 새 스크립트 스레드를 쓰므로 스레드별 연결 대신 풀에서 빌려 쓰고 반납합니다.
+    연결은 필요할 때 최대 size개까지만 생성하며, 모두 사용 중이면 반납될 때까지 기다립니다.
+    """
+    def __init__(self, db_name, size=5):
+        self.db_name = db_name
+        self.size = size
+        self._idle = queue.Queue(maxsize=size)
+        self._created = 0
+        self._lock = threading.Lock()
+        self._borrows = itertools.count(1)
+
+    def _connect(self):
+        # sqlite3는 연결마다 SQL 문자열을 키로 준비된 구문을 LRU 캐시하므로(커서와 무관), 풀의 연결을 재사용하면
+        # 같은 SQL은 다시 파싱되지 않음. 쿼리 종류가 늘어도 밀려나지 않도록 크기를 명시
+        conn = sqlite3.connect(self.db_name, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        conn.row_factory = sqlite3.Row
+        # WAL 모드: 읽기(get_stats 등)가 쓰기(save_user_answer 등)를 막지 않고, 커밋당 fsync 횟수도 줄어듦
+        conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA temp_store=MEMORY;
+            PRAGMA mmap_size=268435456;
+            PRAGMA cache_size=-20000;
+        """)
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if not can_create:
+            return self._idle.get()
+        try:
+            return self._connect()
+        except sqlite3.Error:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    @contextlib.contextmanager
+    def borrow(self):
+        """연결을 하나 빌려 주고, with 블록이 끝나면 (열린 트랜잭션은 롤백한 뒤) 풀에 반납합니다."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            # 오래 살아 있는 연결은 SQLite 권장대로 주기적으로 optimize (지금까지 실행한 쿼리를 바탕으로 필요한 테이블만 ANALYZE)
+            if next(self._borrows) % OPTIMIZE_EVERY_BORROWS == 0:
+                self._optimize(conn)
+            self._idle.put(conn)
+
+    @staticmethod
+    def _optimize(conn):
+        try:
+            conn.execute("PRAGMA optimize")
+        except sqlite3.Error:
+            pass # 다른 연결이 쓰기 중이면 다음 기회에 다시 시도
+
+    def close(self):
+        """유휴 연결마다 PRAGMA optimize를 실행한 뒤 닫습니다. (프로세스 종료 시 호출)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._optimize(conn)
+            conn.close()
+
+_POOL = ConnectionPool(DB_NAME)
+# 남은 답변 저장(아래에서 나중에 등록되어 먼저 실행됨)이 끝난 뒤 연결을 정리
+atexit.register(_POOL.close)
 
 # --- 스키마 설정 ---
+# 예전 버전 DB에 없을 수 있는 컬럼들 (테이블명 -> [(컬럼명, 컬럼 정의)])
+_COLUMN_MIGRATIONS = {
+    'users': [('role', "TEXT NOT NULL DEFAULT 'user'")],
+    'original_questions': [
+        ('media_url', "TEXT"),
+        ('media_type', "TEXT"),
+        ('difficulty', "TEXT NOT NULL DEFAULT '보통'"),
+    ],
+    'user_answers': [('username', "TEXT NOT NULL DEFAULT 'default_user'")],
+    'chat_history': [('session_title', "TEXT")],
+}
+
+# 테이블, 인덱스, 통계 갱신을 한 번의 executescript/트랜잭션으로 실행
+_SCHEMA_DDL = f"""
+BEGIN;
+CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, name TEXT NOT NULL, password TEXT NOT NULL, role TEXT NOT NULL DEFAULT 'user');
+CREATE TABLE IF NOT EXISTS original_questions (
+    id INTEGER PRIMARY KEY, question TEXT NOT NULL, options TEXT NOT NULL,
+    answer TEXT NOT NULL, concept TEXT, media_url TEXT, media_type TEXT,
+    difficulty TEXT NOT NULL DEFAULT '보통'
+);
+CREATE TABLE IF NOT EXISTS modified_questions (id INTEGER PRIMARY KEY AUTOINCREMENT, original_id INTEGER, question TEXT, options TEXT, answer TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE IF NOT EXISTS user_answers (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, question_id INTEGER, question_type TEXT, user_choice TEXT, is_correct BOOLEAN, solved_at DATETIME DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE IF NOT EXISTS ai_explanations (question_id INTEGER NOT NULL, question_type TEXT NOT NULL, explanation TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (question_id, question_type));
+CREATE TABLE IF NOT EXISTS chat_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL,
+    session_id TEXT NOT NULL, session_title TEXT,
+    role TEXT NOT NULL, content TEXT NOT NULL,
+    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE IF NOT EXISTS difficulty_cache (q_hash TEXT PRIMARY KEY, difficulty TEXT NOT NULL);
+
+-- 사용자별 오답 조회(get_wrong_answers)가 user_answers 전체를 스캔하지 않도록 함
+CREATE INDEX IF NOT EXISTS ix_ua_user_correct ON user_answers(username, is_correct, question_type, question_id, solved_at DESC);
+-- 문제 단위 오답 정리(delete_modified_question 등)와 사용자별 단건 삭제(delete_wrong_answer)용
+DROP INDEX IF EXISTS ix_ua_qid_qtype;
+CREATE INDEX IF NOT EXISTS ix_ua_qid_qtype_user ON user_answers(question_id, question_type, username);
+-- 채팅 조회/삭제는 (username, session_id)로 거르고 timestamp로 정렬
+CREATE INDEX IF NOT EXISTS ix_ch_user_sess_ts ON chat_history(username, session_id, timestamp);
+-- session_id 단독 조회(save_chat_message의 세션 존재 확인)와 세션별 MIN(id)용
+CREATE INDEX IF NOT EXISTS ix_ch_sess_min ON chat_history(session_id, id);
+
+-- 저장된 AI 해설은 (문제 ID, 유형) 단위 캐시이므로, 문제 내용이 바뀌거나 삭제되면 함께 지워 오래된 해설이 나오지 않게 함
+-- (JSON 재적재 UPSERT는 내용이 같아도 UPDATE로 처리되므로 실제로 바뀐 경우에만 지움)
+CREATE TRIGGER IF NOT EXISTS tr_oq_update_expl AFTER UPDATE OF question, options, answer ON original_questions
+WHEN OLD.question IS NOT NEW.question OR OLD.options IS NOT NEW.options OR OLD.answer IS NOT NEW.answer
+BEGIN DELETE FROM ai_explanations WHERE question_id = OLD.id AND question_type = 'original'; END;
+CREATE TRIGGER IF NOT EXISTS tr_oq_delete_expl AFTER DELETE ON original_questions
+BEGIN DELETE FROM ai_explanations WHERE question_id = OLD.id AND question_type = 'original'; END;
+CREATE TRIGGER IF NOT EXISTS tr_mq_delete_expl AFTER DELETE ON modified_questions
+BEGIN DELETE FROM ai_explanations WHERE question_id = OLD.id AND question_type = 'modified'; END;
+-- 트리거가 생기기 전에 문제만 삭제되어 남은 해설 정리
+DELETE FROM ai_explanations WHERE question_type = 'original' AND question_id NOT IN (SELECT id FROM original_questions);
+DELETE FROM ai_explanations WHERE question_type = 'modified' AND question_id NOT IN (SELECT id FROM modified_questions);
+
+-- 새 인덱스를 플래너가 고려하도록 통계 갱신
+ANALYZE;
+PRAGMA user_version = {SCHEMA_VERSION};
+COMMIT;
+"""
+
+def _reencode_question_json(conn):
+    """original_questions의 options/answer 중 _dumps 결과와 글자가 다른 행만 다시 저장합니다. (파싱할 수 없는 값은 그대로 둠)"""
+    updates = []
+    for q_id, options, answer in conn.execute("SELECT id, options, answer FROM original_questions"):
+        try:
+            new_options, new_answer = _dumps(_loads(options)), _dumps(_loads(answer))
+        except (ValueError, TypeError):
+            continue
+        if (new_options, new_answer) != (options, answer):
+            updates.append((new_options, new_answer, q_id))
+    if updates:
+        with conn:
+            conn.executemany("UPDATE original_questions SET options = ?, answer = ? WHERE id = ?", updates)
+
 def setup_database_tables():
     """
     앱에 필요한 모든 테이블을 생성하고, 필요한 경우 스키마를 안전하게 업그레이드합니다.
     Streamlit Cloud 환경에서의 반복 실행에도 문제가 없도록 설계되었습니다.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # --- 1. users 테이블 ---
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-    if not cursor.fetchone():
-        cursor.execute('''CREATE TABLE users (username TEXT PRIMARY KEY, name TEXT NOT NULL, password TEXT NOT NULL, role TEXT NOT NULL DEFAULT 'user')''')
-    else:
-        cursor.execute("PRAGMA table_info(users)")
-        if 'role' not in [col['name'] for col in cursor.fetchall()]:
-            cursor.execute("ALTER TABLE users ADD COLUMN role TEXT NOT NULL DEFAULT 'user'")
-
-    # --- 2. original_questions 테이블 ---
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='original_questions'")
-    if not cursor.fetchone():
-        cursor.execute('''
-        CREATE TABLE original_questions (
-            id INTEGER PRIMARY KEY, question TEXT NOT NULL, options TEXT NOT NULL,
-            answer TEXT NOT NULL, concept TEXT, media_url TEXT, media_type TEXT,
-            difficulty TEXT NOT NULL DEFAULT '보통'
-        )''')
-    else:
-        cursor.execute("PRAGMA table_info(original_questions)")
-        columns = [row['name'] for row in cursor.fetchall()]
-        if 'media_url' not in columns: cursor.execute("ALTER TABLE original_questions ADD COLUMN media_url TEXT")
-        if 'media_type' not in columns: cursor.execute("ALTER TABLE original_questions ADD COLUMN media_type TEXT")
-        if 'difficulty' not in columns: cursor.execute("ALTER TABLE original_questions ADD COLUMN difficulty TEXT NOT NULL DEFAULT '보통'")
-
-    # --- 3. modified_questions 테이블 ---
-    cursor.execute('''CREATE TABLE IF NOT EXISTS modified_questions (id INTEGER PRIMARY KEY AUTOINCREMENT, original_id INTEGER, question TEXT, options TEXT, answer TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-
-    # --- 4. user_answers 테이블 ---
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='user_answers'")
-    if not cursor.fetchone():
-        cursor.execute('''CREATE TABLE IF NOT EXISTS user_answers (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, question_id INTEGER, question_type TEXT, user_choice TEXT, is_correct BOOLEAN, solved_at DATETIME DEFAULT CURRENT_TIMESTAMP)''')
-    else:
-        cursor.execute("PRAGMA table_info(user_answers)")
-        if 'username' not in [col['name'] for col in cursor.fetchall()]:
-            cursor.execute("ALTER TABLE user_answers ADD COLUMN username TEXT NOT NULL DEFAULT 'default_user'")
-
-    # --- 5. ai_explanations 테이블 ---
-    cursor.execute('''CREATE TABLE IF NOT EXISTS ai_explanations (question_id INTEGER NOT NULL, question_type TEXT NOT NULL, explanation TEXT, created_at DATETIME DEFAULT CURRENT_TIMESTAMP, PRIMARY KEY (question_id, question_type))''')
-
-    # --- 6. chat_history 테이블 ---
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='chat_history'")
-    if not cursor.fetchone():
-        cursor.execute('''
-        CREATE TABLE chat_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL,
-            session_id TEXT NOT NULL, session_title TEXT,
-            role TEXT NOT NULL, content TEXT NOT NULL,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )''')
-    else:
-        # 테이블이 존재하면, 'session_title' 컬럼이 있는지 확인
-        cursor.execute("PRAGMA table_info(chat_history)")
-        columns = [row['name'] for row in cursor.fetchall()]
-        # 컬럼이 없을 때만 ALTER TABLE 실행
-        if 'session_title' not in columns:
-            cursor.execute("ALTER TABLE chat_history ADD COLUMN session_title TEXT")
-
-    conn.commit()
-    conn.close()
-    print("모든 데이터베이스 테이블 확인/생성/업그레이드 완료.")
+    with _POOL.borrow() as conn:
+        # 이미 현재 버전으로 설정된 DB라면 스키마 확인 쿼리를 모두 건너뜀
+        if conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION:
+            return
+
+        # 1. 이미 존재하는 예전 테이블에 빠진 컬럼 추가 (인덱스가 새 컬럼을 참조하므로 DDL보다 먼저)
+        #    테이블이 아직 없으면 table_info가 빈 결과를 주므로 건너뛰고, 아래 DDL이 전체 스키마로 생성함
+        for table, new_columns in _COLUMN_MIGRATIONS.items():
+            existing = {row['name'] for row in conn.execute(f"PRAGMA table_info({table})")}
+            if not existing:
+                continue
+            for column, definition in new_columns:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+        # 2. 예전 형식으로 저장된 options/answer를 현재 직렬화 형식으로 통일
+        #    (tr_oq_update_expl은 텍스트를 그대로 비교하므로, 통일하지 않으면 첫 JSON 재적재에서 내용이 같아도 모든 해설이 지워짐)
+        #    다시 쓰는 동안 트리거가 해설을 지우지 않도록 먼저 삭제하고, 아래 DDL에서 다시 생성
+        conn.execute("DROP TRIGGER IF EXISTS tr_oq_update_expl")
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'original_questions'").fetchone():
+            _reencode_question_json(conn)
+
+        # 3. 테이블/인덱스 생성, 통계 갱신, 스키마 버전 기록
+        conn.executescript(_SCHEMA_DDL)
+        print("모든 데이터베이스 테이블 확인/생성/업그레이드 완료.")
 
 # --- 데이터 로딩/내보내기 ---
-def load_original_questions_from_json(questions_with_difficulty: list):
-    """'난이도'가 포함된 문제 리스트를 받아 DB를 새로 고칩니다."""
-    if not questions_with_difficulty:
-        return 0, "입력된 문제 데이터가 없습니다."
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM original_questions")
-    for q in questions_with_difficulty:
-        cursor.execute(
-            "INSERT INTO original_questions (id, question, options, answer, difficulty, media_url, media_type) VALUES (?, ?, ?, ?, ?, ?, ?)",
-            (q.get('id'), q.get('question'), json.dumps(q.get('options', {})), json.dumps(q.get('answer', [])), q.get('difficulty', '보통'), q.get('media_url'), q.get('media_type'))
-        )
-    conn.commit()
-    conn.close()
-    return len(questions_with_difficulty), None
+def load_original_questions_from_json(questions_with_difficulty):
+    """
+    '난이도'가 포함된 문제들을 받아 DB를 새로 고칩니다.
+    리스트뿐 아니라 제너레이터도 받을 수 있으며, LOAD_CHUNK_SIZE개씩 나눠 저장하므로 전체를 메모리에 올릴 필요가 없습니다.
+    """
+    questions = iter(questions_with_difficulty or ())
+    with _POOL.borrow() as conn:
+        cursor = conn.cursor()
+        # 적재 구간에서만 fsync를 끄고 끝나면 원래대로 되돌림 (트랜잭션 밖에서만 변경 가능)
+        # journal_mode=OFF는 실패 시 롤백이 불가능해지므로 WAL을 그대로 유지
+        cursor.execute("PRAGMA synchronous=OFF")
+        try:
+            # 쓰기 잠금을 처음부터 한 번만 획득하여, 적재 도중 잠금 승격/SQLITE_BUSY 재시도를 피함
+            # (잠금을 얻지 못해 실패해도 아래 finally에서 synchronous를 되돌려야 풀의 연결에 OFF가 남지 않음)
+            cursor.execute("BEGIN IMMEDIATE")
+            count = 0
+            loaded_ids = []
+            # id가 없는 문제는 새 id(현재 최대 rowid + 1)를 받으므로, 입력 중간에 넣으면 뒤쪽 청크의 같은 명시적 id가 UPSERT로 덮어씀
+            # 명시적 id를 모두 반영하고 정리까지 끝낸 뒤 마지막에 삽입
+            rows_without_id = []
+            while True:
+                chunk = list(itertools.islice(questions, LOAD_CHUNK_SIZE))
+                if not chunk:
+                    break
+                rows = [
+                    (q.get('id'), q.get('question'), _dumps(q.get('options', {})), _dumps(q.get('answer', [])), q.get('difficulty', '보통'), q.get('media_url'), q.get('media_type'))
+                    for q in chunk
+                ]
+                # 전체 삭제 후 재삽입 대신 UPSERT로 기존 행을 제자리에서 갱신 (rowid와 변형 문제의 original_id 참조 유지)
+                cursor.executemany(_UPSERT_ORIGINAL_QUESTION_SQL, (row for row in rows if row[0] is not None))
+                loaded_ids.extend(row[0] for row in rows if row[0] is not None)
+                rows_without_id.extend(row for row in rows if row[0] is None)
+                count += len(chunk)
+            if count == 0:
+                # 빈 입력으로 기존 문제가 모두 정리되지 않도록 아무것도 바꾸지 않음
+                conn.rollback()
+                return 0, "입력된 문제 데이터가 없습니다."
+            # JSON 파일에 더 이상 없는 문제만 정리
+            cursor.execute("DELETE FROM original_questions WHERE id NOT IN (SELECT value FROM json_each(?))", (_dumps(loaded_ids),))
+            cursor.executemany(_UPSERT_ORIGINAL_QUESTION_SQL, rows_without_id)
+            # 대량 적재 후 쿼리 플래너가 참고할 통계(sqlite_stat1)를 갱신
+            cursor.execute("ANALYZE")
+            conn.commit()
+            _invalidate_question_cache()
+        except Exception:
+            # 연결을 재사용하므로 실패한 트랜잭션이 다음 호출로 넘어가지 않도록 되돌림
+            # (트랜잭션 안에서는 synchronous를 바꿀 수 없으므로 입력 데이터 오류 등 모든 예외에서 먼저 롤백)
+            conn.rollback()
+            raise
+        finally:
+            cursor.execute("PRAGMA synchronous=NORMAL")
+        return count, None
 
 def export_questions_to_json_format():
     """DB의 모든 원본 문제를 JSON 파일 형식(dict 리스트)으로 변환하여 반환합니다."""
-    conn = get_db_connection()
-    all_rows = conn.execute("SELECT * FROM original_questions ORDER BY id ASC").fetchall()
-    conn.close()
-    questions_list = []
-    for row in all_rows:
-        q_dict = dict(row)
-        try: q_dict['options'] = json.loads(q_dict['options'])
-        except: q_dict['options'] = {}
-        try: q_dict['answer'] = json.loads(q_dict['answer'])
-        except: q_dict['answer'] = []
-        questions_list.append(q_dict)
-    return questions_list
+    with _POOL.borrow() as conn:
+        # fetchall 없이 커서를 바로 순회하고, 빈 값은 파싱 전에 걸러 예외 처리 비용을 피함
+        cursor = conn.execute(
+            "SELECT id, question, options, answer, concept, media_url, media_type, difficulty FROM original_questions ORDER BY id ASC"
+        )
+        return [
+            {
+                'id': q_id, 'question': question,
+                'options': _cached_json_loads('options', q_id, options, dict) if options else {},
+                'answer': _cached_json_loads('answer', q_id, answer, list) if answer else [],
+                'concept': concept, 'media_url': media_url, 'media_type': media_type, 'difficulty': difficulty,
+            }
+            for q_id, question, options, answer, concept, media_url, media_type, difficulty in cursor
+        ]
 
 # --- 문제 관리 (CRUD) ---
+# 문제는 퀴즈 도중 거의 바뀌지 않으므로 프로세스 단위로 캐시하고, 변경 함수에서 _invalidate_question_cache()로 비웁니다.
+@functools.lru_cache(maxsize=16)
+def _get_question_ids_by_difficulty_cached(difficulty):
+    with _POOL.borrow() as conn:
+        if difficulty == '모든 난이도':
+            rows = conn.execute("SELECT id FROM original_questions ORDER BY id ASC").fetchall()
+        else:
+            rows = conn.execute("SELECT id FROM original_questions WHERE difficulty = ? ORDER BY id ASC", (difficulty,)).fetchall()
+        return tuple(row['id'] for row in rows)
+
+@functools.lru_cache(maxsize=1)
+def _get_modified_question_ids_cached():
+    with _POOL.borrow() as conn:
+        return tuple(row['id'] for row in conn.execute("SELECT id FROM modified_questions ORDER BY id ASC").fetchall())
+
+@functools.lru_cache(maxsize=2048)
+def _get_question_by_id_cached(q_id, q_type):
+    # 테이블명을 f-string으로 끼워 넣지 않고 타입별 고정 SQL을 골라 씀
+    sql = _GET_ORIGINAL_QUESTION_SQL if q_type == 'original' else _GET_MODIFIED_QUESTION_SQL
+    with _POOL.borrow() as conn:
+        row = conn.execute(sql, (q_id,)).fetchone()
+        return dict(row) if row else None
+
+def _invalidate_question_cache():
+    """문제 데이터가 바뀐 뒤 호출하여 캐시된 문제/ID 목록을 비웁니다."""
+    _get_question_ids_by_difficulty_cached.cache_clear()
+    _get_modified_question_ids_cached.cache_clear()
+    _get_question_by_id_cached.cache_clear()
+    _JSON_CACHE.clear()
+
 def get_question_ids_by_difficulty(difficulty='모든 난이도'):
     """특정 난이도의 원본 문제 ID 목록을 반환합니다."""
-    conn = get_db_connection()
-    if difficulty == '모든 난이도':
-        ids = [row['id'] for row in conn.execute("SELECT id FROM original_questions ORDER BY id ASC").fetchall()]
-    else:
-        ids = [row['id'] for row in conn.execute("SELECT id FROM original_questions WHERE difficulty = ? ORDER BY id ASC", (difficulty,)).fetchall()]
-    conn.close()
-    return ids
+    return list(_get_question_ids_by_difficulty_cached(difficulty))
 
 def get_all_question_ids(q_type='original'):
     """'original' 또는 'modified' 타입의 모든 문제 ID 목록을 반환합니다."""
     if q_type == 'original':
         return get_question_ids_by_difficulty('모든 난이도')
     else:
-        conn = get_db_connection()
-        ids = [row['id'] for row in conn.execute("SELECT id FROM modified_questions ORDER BY id ASC").fetchall()]
-        conn.close()
-        return ids
+        return list(_get_modified_question_ids_cached())
 
 def get_question_by_id(q_id, q_type='original'):
-    """ID와 타입으로 특정 문제를 딕셔너리 형태로 반환합니다."""
-    table_name = 'original_questions' if q_type == 'original' else 'modified_questions'
-    conn = get_db_connection()
-    row = conn.execute(f"SELECT * FROM {table_name} WHERE id = ?", (q_id,)).fetchone()
-    conn.close()
-    return dict(row) if row else None
+    """ID와 타입으로 특정 문제를 딕셔너리 형태로 반환합니다. (호출자가 수정해도 캐시에 영향이 없도록 복사본을 반환)"""
+    question = _get_question_by_id_cached(q_id, q_type)
+    return dict(question) if question else None
+
+def get_questions_by_ids(id_type_pairs):
+    """
+    여러 문제를 타입별 SELECT 한 번씩(최대 2번)으로 가져와 {(id, 타입): 문제 dict}로 반환합니다.
+    결과 화면처럼 한 번에 많은 문제가 필요할 때 get_question_by_id를 문제마다 호출하는 대신 사용합니다. (없는 문제는 제외)
+    """
+    ids_by_type = {}
+    for q_id, q_type in id_type_pairs:
+        ids_by_type.setdefault(q_type, set()).add(q_id)
+
+    questions = {}
+    with _POOL.borrow() as conn:
+        for q_type, ids in ids_by_type.items():
+            sql = _GET_ORIGINAL_QUESTIONS_SQL if q_type == 'original' else _GET_MODIFIED_QUESTIONS_SQL
+            for row in conn.execute(sql, (_dumps(list(ids)),)):
+                questions[(row['id'], q_type)] = dict(row)
+    return questions
 
 def add_new_original_question(question_text, options_dict, answer_list, difficulty, media_url=None, media_type=None):
     """새로운 원본 문제를 DB에 추가하고 새 ID를 반환합니다."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT IFNULL(MAX(id), 0) + 1 FROM original_questions")
-    new_id = cursor.fetchone()[0]
-    cursor.execute(
-        "INSERT INTO original_questions (id, question, options, answer, difficulty, media_url, media_type) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (new_id, question_text, json.dumps(options_dict), json.dumps(answer_list), difficulty, media_url, media_type)
-    )
-    conn.commit()
-    conn.close()
-    return new_id
+    with _POOL.borrow() as conn:
+        with conn:
+            # id는 INTEGER PRIMARY KEY이므로 SQLite가 다음 rowid(MAX+1)를 배정하고 RETURNING으로 바로 돌려받음
+            new_id = conn.execute(
+                "INSERT INTO original_questions (question, options, answer, difficulty, media_url, media_type) VALUES (?, ?, ?, ?, ?, ?) RETURNING id",
+                (question_text, _dumps(options_dict), _dumps(answer_list), difficulty, media_url, media_type)
+            ).fetchone()[0]
+        _invalidate_question_cache()
+        return new_id
 
 def update_original_question(q_id, question_text, options_dict, answer_list, difficulty, media_url=None, media_type=None):
     """ID를 기반으로 원본 문제의 내용을 업데이트합니다."""
-    conn = get_db_connection()
-    conn.execute(
-        "UPDATE original_questions SET question=?, options=?, answer=?, difficulty=?, media_url=?, media_type=? WHERE id=?",
-        (question_text, json.dumps(options_dict), json.dumps(answer_list), difficulty, media_url, media_type, q_id)
-    )
-    conn.commit()
-    conn.close()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute(
+                "UPDATE original_questions SET question=?, options=?, answer=?, difficulty=?, media_url=?, media_type=? WHERE id=?",
+                (question_text, _dumps(options_dict), _dumps(answer_list), difficulty, media_url, media_type, q_id)
+            )
+        _invalidate_question_cache()
 
 def clear_all_original_questions():
     """DB에서 모든 원본 문제와 관련 오답 기록을 삭제합니다."""
-    conn = get_db_connection()
-    conn.execute("DELETE FROM user_answers WHERE question_type = 'original'")
-    conn.execute("DELETE FROM original_questions")
-    conn.commit()
-    conn.close()
+    _flush_answer_queue()
+    with _POOL.borrow() as conn:
+        with conn:
+            # 두 DELETE가 하나의 쓰기 잠금 안에서 실행되도록 처음부터 RESERVED 잠금을 잡음
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM user_answers WHERE question_type = 'original'")
+            conn.execute("DELETE FROM original_questions")
+        _invalidate_question_cache()
 
 # --- 사용자 관리 ---
 def fetch_all_users():
     """모든 사용자 정보를 Authenticator용과 추가 정보용으로 분리하여 반환합니다."""
-    conn = get_db_connection()
-    users = conn.execute("SELECT * FROM users").fetchall()
-    conn.close()
-    credentials = {"usernames": {}}
-    all_user_info = {}
-    for user in users:
-        username = user['username']
-        credentials["usernames"][username] = {
-            "name": user['name'],
-            "password": user['password']
-        }              
-        role = user['role'] if 'role' in user.keys() else 'user'     
-        all_user_info[username] = {
-            "name": user['name'],
-            "role": role,
-            "password": user['password']
-        }
-    return credentials, all_user_info
+    with _POOL.borrow() as conn:
+        # role 컬럼은 setup_database_tables에서 항상 보장되므로 필요한 컬럼만 지정
+        # 비밀번호 해시는 credentials에만 두고, all_user_info에는 이름/역할만 담음
+        users = conn.execute("SELECT username, name, password, role FROM users").fetchall()
+        credentials = {"usernames": {u['username']: {"name": u['name'], "password": u['password']} for u in users}}
+        all_user_info = {u['username']: {"name": u['name'], "role": u['role']} for u in users}
+        return credentials, all_user_info
 
 def add_new_user(username, name, hashed_password):
     """새로운 사용자를 추가합니다."""
-    conn = get_db_connection()
-    try:
-        conn.execute("INSERT INTO users (username, name, password) VALUES (?, ?, ?)", (username, name, hashed_password))
-        conn.commit()
-        return True, None
-    except sqlite3.IntegrityError:
-        return False, "이미 존재하는 아이디입니다."
-    finally: conn.close()
+    with _POOL.borrow() as conn:
+        try:
+            with conn:
+                conn.execute("INSERT INTO users (username, name, password) VALUES (?, ?, ?)", (username, name, hashed_password))
+            return True, None
+        except sqlite3.IntegrityError:
+            # with 블록이 이미 롤백함
+            return False, "이미 존재하는 아이디입니다."
 
 def delete_user(username):
     """특정 사용자와 관련 학습 기록을 모두 삭제합니다."""
-    conn = get_db_connection()
-    conn.execute("DELETE FROM user_answers WHERE username = ?", (username,))
-    conn.execute("DELETE FROM users WHERE username = ?", (username,))
-    conn.commit()
-    conn.close()
+    _flush_answer_queue()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM user_answers WHERE username = ?", (username,))
+            conn.execute("DELETE FROM users WHERE username = ?", (username,))
 
 def get_all_users_for_admin():
     """관리자용으로 모든 사용자 목록을 반환합니다."""
-    conn = get_db_connection()
-    users = conn.execute("SELECT username, name, role FROM users ORDER BY username ASC").fetchall()
-    conn.close()
-    return users
+    with _POOL.borrow() as conn:
+        users = conn.execute("SELECT username, name, role FROM users ORDER BY username ASC").fetchall()
+        return users
 
 def ensure_master_account(username, name, hashed_password):
     """마스터 관리자 계정이 존재하도록 보장합니다."""
-    conn = get_db_connection()
-    conn.execute("INSERT OR REPLACE INTO users (username, name, password, role) VALUES (?, ?, ?, ?)", (username, name, hashed_password, 'admin'))
-    conn.commit()
-    conn.close()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO users (username, name, password, role) VALUES (?, ?, ?, ?)", (username, name, hashed_password, 'admin'))
 
 # --- 답변 기록 및 통계 ---
+# 답변은 클릭마다 바로 커밋하지 않고 큐에 모았다가 백그라운드 스레드가 한 트랜잭션으로 저장함
+# user_answers를 읽거나 지우는 함수는 먼저 _flush_answer_queue()를 호출해 대기 중인 답변을 반영함
+ANSWER_FLUSH_BATCH = 32       # 이 개수만큼 쌓이면 주기를 기다리지 않고 바로 저장
+ANSWER_FLUSH_INTERVAL = 0.25  # 초 단위 저장 주기
+ANSWER_RETRY_MAX_DELAY = 5.0  # 저장 실패 시 재시도 간격의 상한(초)
+
+_answer_queue = queue.Queue()
+# 큐에서 꺼냈지만 아직 커밋되지 않은 답변 (저장이 실패하면 여기에 남아 다음 저장 때 다시 시도)
+_unsaved_answers = []
+_answer_flush_lock = threading.Lock()
+_answer_flush_event = threading.Event()
+_answer_writer = None
+_answer_writer_lock = threading.Lock()
+
+def _flush_answer_queue():
+    """
+    큐에 쌓인 답변 기록을 executemany 한 번으로 저장합니다.
+    저장에 실패하면 답변을 버리지 않고 _unsaved_answers에 남겨 둔 채 예외를 그대로 올립니다.
+    """
+    with _answer_flush_lock:
+        while True:
+            try:
+                _unsaved_answers.append(_answer_queue.get_nowait())
+            except queue.Empty:
+                break
+        if not _unsaved_answers:
+            return
+        with _POOL.borrow() as conn:
+            with conn:
+                conn.executemany(_SAVE_ANSWER_SQL, _unsaved_answers)
+        _unsaved_answers.clear()
+
+def _answer_writer_loop():
+    delay = ANSWER_FLUSH_INTERVAL
+    while True:
+        _answer_flush_event.wait(delay)
+        _answer_flush_event.clear()
+        try:
+            _flush_answer_queue()
+            delay = ANSWER_FLUSH_INTERVAL
+        except Exception as e:
+            # 어떤 예외든 스레드가 죽지 않도록 잡고, DB가 잠겨 있는 동안은 간격을 늘려 가며 재시도
+            print(f"답변 기록 저장 실패 (재시도 예정): {e}")
+            delay = min(delay * 2, ANSWER_RETRY_MAX_DELAY)
+
+def _ensure_answer_writer():
+    global _answer_writer
+    if _answer_writer is None or not _answer_writer.is_alive():
+        with _answer_writer_lock:
+            if _answer_writer is None or not _answer_writer.is_alive():
+                _answer_writer = threading.Thread(target=_answer_writer_loop, name="answer-writer", daemon=True)
+                _answer_writer.start()
+
+# 프로세스 종료 시 남은 답변을 저장
+atexit.register(_flush_answer_queue)
+
 def save_user_answer(username, q_id, q_type, user_choice, is_correct):
-    """사용자의 답변 기록을 저장합니다."""
-    conn = get_db_connection()
-    conn.execute(
-        "INSERT INTO user_answers (username, question_id, question_type, user_choice, is_correct) VALUES (?, ?, ?, ?, ?)",
-        (username, q_id, q_type, json.dumps(user_choice), is_correct)
-    )
-    conn.commit()
-    conn.close()
+    """사용자의 답변 기록을 저장 대기열에 추가합니다. (잠시 후 일괄 저장됨)"""
+    # 문자열/숫자 같은 단일 값은 그대로 저장하고, 리스트/딕셔너리만 JSON으로 직렬화
+    stored_choice = user_choice if isinstance(user_choice, (str, int, float)) else _dumps(user_choice)
+    # 저장 시점이 늦어져도 풀이 시각이 바뀌지 않도록 CURRENT_TIMESTAMP와 같은 형식(UTC)으로 미리 기록
+    solved_at = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    _answer_queue.put((username, q_id, q_type, stored_choice, is_correct, solved_at))
+    _ensure_answer_writer()
+    if _answer_queue.qsize() >= ANSWER_FLUSH_BATCH:
+        _answer_flush_event.set()
+
+def delete_all_user_answers(username):
+    """특정 사용자의 모든 답변 기록을 삭제합니다."""
+    _flush_answer_queue()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute("DELETE FROM user_answers WHERE username = ?", (username,))
 
 def get_wrong_answers(username: str):
     """특정 사용자의 틀린 문제 목록(상세 정보 포함)을 가져옵니다."""
-    conn = get_db_connection()
-    query = """
-    WITH all_questions AS (
-        SELECT 'original' as type, id, question, options, answer, media_url, media_type, difficulty FROM original_questions
+    _flush_answer_queue()
+    with _POOL.borrow() as conn:
+        # 타입별로 인덱스(ix_ua_user_correct)를 타는 SELECT 두 개를 UNION ALL (CTE 전체를 구체화하지 않음)
+        query = """
+        SELECT
+            ua.question_id AS question_id, ua.question_type AS question_type, 'original' AS type,
+            q.id, q.question, q.options, q.answer, q.media_url, q.media_type, q.difficulty,
+            MAX(ua.solved_at) AS last_solved_at
+        FROM user_answers ua
+        JOIN original_questions q ON q.id = ua.question_id
+        WHERE ua.username = ? AND ua.is_correct = 0 AND ua.question_type = 'original'
+        GROUP BY ua.question_id
         UNION ALL
-        SELECT 'modified' as type, id, question, options, answer, NULL as media_url, NULL as media_type, '보통' as difficulty FROM modified_questions
-    )
-    SELECT 
-        ua.question_id AS question_id, 
-        ua.question_type AS question_type, 
-        q.*
-    FROM user_answers ua
-    JOIN all_questions q ON ua.question_id = q.id AND ua.question_type = q.type
-    WHERE ua.is_correct = 0 AND ua.username = ?
-    GROUP BY ua.question_id, ua.question_type 
-    ORDER BY MAX(ua.solved_at) DESC
-    """
-    wrong_answers = conn.execute(query, (username,)).fetchall()
-    conn.close()
-    return wrong_answers
+        SELECT
+            ua.question_id AS question_id, ua.question_type AS question_type, 'modified' AS type,
+            q.id, q.question, q.options, q.answer, NULL AS media_url, NULL AS media_type, '보통' AS difficulty,
+            MAX(ua.solved_at) AS last_solved_at
+        FROM user_answers ua
+        JOIN modified_questions q ON q.id = ua.question_id
+        WHERE ua.username = ? AND ua.is_correct = 0 AND ua.question_type = 'modified'
+        GROUP BY ua.question_id
+        ORDER BY last_solved_at DESC
+        """
+        wrong_answers = conn.execute(query, (username, username)).fetchall()
+        return wrong_answers
 
 def delete_wrong_answer(username, question_id, question_type):
     """특정 사용자의 특정 오답 기록을 삭제합니다."""
-    conn = get_db_connection()
-    conn.execute("DELETE FROM user_answers WHERE question_id = ? AND question_type = ? AND username = ?", (question_id, question_type, username))
-    conn.commit()
-    conn.close()
+    _flush_answer_queue()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute("DELETE FROM user_answers WHERE question_id = ? AND question_type = ? AND username = ?", (question_id, question_type, username))
 
 def get_stats(username):
     """특정 사용자의 학습 통계를 계산하여 반환합니다."""
-    conn = get_db_connection()
-    try:
-        df = pd.read_sql_query("SELECT is_correct FROM user_answers WHERE username = ?", conn, params=(username,))
-        total = len(df)
-        if total == 0: return 0, 0, 0.0
-        correct = int(df['is_correct'].sum())
-        accuracy = (correct / total) * 100
-        return total, correct, accuracy
-    except: return 0, 0, 0.0
-    finally: conn.close()
+    _flush_answer_queue()
+    with _POOL.borrow() as conn:
+        try:
+            # 전체 행을 가져오지 않고 SQLite에서 바로 집계 (username 인덱스 사용)
+            row = conn.execute(
+                "SELECT COUNT(*) AS total, COALESCE(SUM(is_correct), 0) AS correct FROM user_answers WHERE username = ?",
+                (username,)
+            ).fetchone()
+            total, correct = row['total'], int(row['correct'])
+            accuracy = correct * 100.0 / total if total else 0.0
+            return total, correct, accuracy
+        except sqlite3.Error: return 0, 0, 0.0
 
 def get_top_5_missed(username):
-    """특정 사용자가 가장 많이 틀린 문제 Top 5를 DataFrame으로 반환합니다."""
-    conn = get_db_connection()
-    try:
-        query = """
-        SELECT q.id, q.question, COUNT(*) as wrong_count
-        FROM user_answers ua JOIN original_questions q ON ua.question_id = q.id
-        WHERE ua.is_correct = 0 AND ua.question_type = 'original' AND ua.username = ?
-        GROUP BY q.id, q.question ORDER BY wrong_count DESC, q.id ASC LIMIT 5
-        """
-        return pd.read_sql_query(query, conn, params=(username,))
-    except: return pd.DataFrame()
-    finally: conn.close()
+    """특정 사용자가 가장 많이 틀린 문제 Top 5를 dict 리스트(id, question, wrong_count)로 반환합니다."""
+    _flush_answer_queue()
+    with _POOL.borrow() as conn:
+        try:
+            # question_id(정수)로만 먼저 집계해 상위 5개를 고른 뒤, 그 5개에 대해서만 문제 본문을 조인
+            # (삭제된 문제는 집계 단계에서 제외해야 기존처럼 다음 순위 문제가 채워짐)
+            query = """
+            SELECT q.id, q.question, wc.wrong_count
+            FROM (
+                SELECT question_id, COUNT(*) AS wrong_count
+                FROM user_answers
+                WHERE is_correct = 0 AND question_type = 'original' AND username = ?
+                  AND question_id IN (SELECT id FROM original_questions)
+                GROUP BY question_id
+                ORDER BY wrong_count DESC, question_id ASC
+                LIMIT 5
+            ) wc
+            JOIN original_questions q ON q.id = wc.question_id
+            ORDER BY wc.wrong_count DESC, q.id ASC
+            """
+            # 5행짜리 결과에 DataFrame을 만들 필요 없이 바로 dict로 변환
+            return [dict(row) for row in conn.execute(query, (username,)).fetchall()]
+        except sqlite3.Error: return []
 
 # --- AI 변형 문제 관리 ---
 def get_all_modified_questions():
     """모든 AI 변형 문제의 상세 정보를 가져옵니다."""
-    conn = get_db_connection()
-    questions = conn.execute("SELECT * FROM modified_questions ORDER BY id DESC").fetchall()
-    conn.close()
-    return questions
+    with _POOL.borrow() as conn:
+        questions = conn.execute("SELECT * FROM modified_questions ORDER BY id DESC").fetchall()
+        return questions
 
 def save_modified_question(original_id, q_data):
     """AI가 생성한 변형 문제를 저장하고 새 ID를 반환합니다."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO modified_questions (original_id, question, options, answer) VALUES (?, ?, ?, ?)",
-        (original_id, q_data['question'], json.dumps(q_data['options']), json.dumps(q_data['answer']))
-    )
-    new_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
-    return new_id
+    with _POOL.borrow() as conn:
+        cursor = conn.cursor()
+        with conn:
+            cursor.execute(
+                "INSERT INTO modified_questions (original_id, question, options, answer) VALUES (?, ?, ?, ?)",
+                (original_id, q_data['question'], _dumps(q_data['options']), _dumps(q_data['answer']))
+            )
+            new_id = cursor.lastrowid
+        _invalidate_question_cache()
+        return new_id
 
 def delete_modified_question(question_id):
     """특정 AI 변형 문제와 관련 오답 기록을 삭제합니다."""
-    conn = get_db_connection()
-    conn.execute("DELETE FROM user_answers WHERE question_id = ? AND question_type = 'modified'", (question_id,))
-    conn.execute("DELETE FROM modified_questions WHERE id = ?", (question_id,))
-    conn.commit()
-    conn.close()
+    _flush_answer_queue()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM user_answers WHERE question_id = ? AND question_type = 'modified'", (question_id,))
+            conn.execute("DELETE FROM modified_questions WHERE id = ?", (question_id,))
+        _invalidate_question_cache()
 
 def clear_all_modified_questions():
     """모든 AI 변형 문제와 관련 오답 기록을 삭제합니다."""
-    conn = get_db_connection()
-    conn.execute("DELETE FROM user_answers WHERE question_type = 'modified'")
-    conn.execute("DELETE FROM modified_questions")
-    conn.commit()
-    conn.close() 
+    _flush_answer_queue()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM user_answers WHERE question_type = 'modified'")
+            conn.execute("DELETE FROM modified_questions")
+        _invalidate_question_cache()
 
 # --- AI 해설 관리 ---
 def save_ai_explanation(q_id, q_type, explanation_json):
     """생성된 AI 해설을 DB에 저장하거나 업데이트합니다."""
-    conn = get_db_connection()
-    conn.execute(
-        "INSERT OR REPLACE INTO ai_explanations (question_id, question_type, explanation) VALUES (?, ?, ?)",
-        (q_id, q_type, explanation_json)
-    )
-    conn.commit()
-    conn.close()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ai_explanations (question_id, question_type, explanation) VALUES (?, ?, ?)",
+                (q_id, q_type, explanation_json)
+            )
 
 def get_ai_explanation_from_db(q_id, q_type):
     """DB에서 저장된 AI 해설을 가져옵니다."""
-    conn = get_db_connection()
-    row = conn.execute(
-        "SELECT explanation FROM ai_explanations WHERE question_id = ? AND question_type = ?",
-        (q_id, q_type)
-    ).fetchone()
-    conn.close()
-    return json.loads(row['explanation']) if row else None
+    with _POOL.borrow() as conn:
+        row = conn.execute(
+            "SELECT explanation FROM ai_explanations WHERE question_id = ? AND question_type = ?",
+            (q_id, q_type)
+        ).fetchone()
+        return _loads(row['explanation']) if row else None
 
 def delete_ai_explanation(q_id, q_type):
     """DB에서 특정 AI 해설을 삭제합니다."""
-    conn = get_db_connection()
-    conn.execute("DELETE FROM ai_explanations WHERE question_id = ? AND question_type = ?", (q_id, q_type))
-    conn.commit()
-    conn.close()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute("DELETE FROM ai_explanations WHERE question_id = ? AND question_type = ?", (q_id, q_type))
 
 def get_all_explanations_for_admin():
     """관리자용으로 저장된 모든 AI 해설 목록을 가져옵니다."""
-    conn = get_db_connection()
-    rows = conn.execute("SELECT question_id, question_type FROM ai_explanations ORDER BY question_id").fetchall()
-    conn.close()
-    return rows
+    with _POOL.borrow() as conn:
+        rows = conn.execute("SELECT question_id, question_type FROM ai_explanations ORDER BY question_id").fetchall()
+        return rows
+
+# --- AI 난이도 분석 캐시 ---
+# 같은 문제 본문은 다시 분석하지 않도록 본문 해시별로 분석 결과를 보관
+def _difficulty_key(question_text):
+    # 공백 차이만 있는 문제는 같은 문제로 취급
+    return hashlib.sha1(" ".join(question_text.split()).encode("utf-8")).hexdigest()
+
+def get_cached_difficulties(question_texts):
+    """캐시에 저장된 난이도를 {문제 본문: 난이도} 딕셔너리로 반환합니다. (캐시에 없는 문제는 제외)"""
+    texts_by_key = {_difficulty_key(text): text for text in question_texts}
+    if not texts_by_key:
+        return {}
+    with _POOL.borrow() as conn:
+        rows = conn.execute(
+            "SELECT q_hash, difficulty FROM difficulty_cache WHERE q_hash IN (SELECT value FROM json_each(?))",
+            (_dumps(list(texts_by_key)),)
+        ).fetchall()
+    return {texts_by_key[q_hash]: difficulty for q_hash, difficulty in rows}
+
+def save_cached_difficulties(difficulties_by_text):
+    """{문제 본문: 난이도} 딕셔너리를 난이도 캐시에 저장합니다."""
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO difficulty_cache (q_hash, difficulty) VALUES (?, ?)",
+                ((_difficulty_key(text), difficulty) for text, difficulty in difficulties_by_text.items())
+            )
 
 # --- AI 튜터 채팅 기록 관리 ---
 def get_chat_history(username, session_id):
     """특정 사용자의 특정 채팅 세션 기록을 가져옵니다."""
-    conn = get_db_connection()
-    history = conn.execute(
-        "SELECT role, content FROM chat_history WHERE username = ? AND session_id = ? ORDER BY timestamp ASC",
-        (username, session_id)
-    ).fetchall()
-    conn.close()
-    return [{"role": row['role'], "parts": [row['content']]} for row in history]
+    with _POOL.borrow() as conn:
+        history = conn.execute(_CHAT_HISTORY_SQL, (username, session_id)).fetchall()
+        return [{"role": row['role'], "parts": [row['content']]} for row in history]
 
 def save_chat_message(username, session_id, role, content, session_title=None):
     """
     채팅 메시지를 DB에 저장합니다.
     session_title이 제공되면 함께 저장하거나 업데이트합니다.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 먼저 해당 세션이 존재하는지 확인
-    cursor.execute("SELECT COUNT(*) FROM chat_history WHERE session_id = ?", (session_id,))
-    session_exists = cursor.fetchone()[0] > 0
-
-    if session_exists:
-        # 세션이 이미 존재하면, 메시지만 추가
-        cursor.execute(
-            "INSERT INTO chat_history (username, session_id, role, content) VALUES (?, ?, ?, ?)",
-            (username, session_id, role, content)
-        )
-    else:
-        # 세션의 첫 메시지이면, 제목과 함께 추가
-        # 제목이 없으면 content의 일부를 사용
-        title_to_save = session_title if session_title else content[:30]
-        cursor.execute(
-            "INSERT INTO chat_history (username, session_id, session_title, role, content) VALUES (?, ?, ?, ?, ?)",
-            (username, session_id, title_to_save, role, content)
-        )
-
-    conn.commit()
-    conn.close()
+    with _POOL.borrow() as conn:
+        cursor = conn.cursor()
+
+        with conn:
+            # 먼저 해당 세션이 존재하는지 확인
+            cursor.execute(_CHAT_SESSION_EXISTS_SQL, (session_id,))
+            session_exists = cursor.fetchone()[0] > 0
+
+            if session_exists:
+                # 세션이 이미 존재하면, 메시지만 추가
+                cursor.execute(
+                    _SAVE_CHAT_SQL,
+                    (username, session_id, role, content)
+                )
+            else:
+                # 세션의 첫 메시지이면, 제목과 함께 추가
+                # 제목이 없으면 content의 일부를 사용
+                title_to_save = session_title if session_title else content[:30]
+                cursor.execute(
+                    _SAVE_CHAT_WITH_TITLE_SQL,
+                    (username, session_id, title_to_save, role, content)
+                )
 
 def get_chat_sessions(username):
     """특정 사용자의 모든 채팅 세션 ID와 첫 메시지를 가져옵니다."""
-    conn = get_db_connection()
-    query = """
-    SELECT session_id, session_title, content
-    FROM chat_history
-    WHERE id IN (
-        SELECT MIN(id)
-        FROM chat_history
-        WHERE username = ?
-        GROUP BY session_id
-    )
-    ORDER BY timestamp DESC
-    """
-    sessions = conn.execute(query, (username,)).fetchall()
-    conn.close()
-    return sessions
+    with _POOL.borrow() as conn:
+        # 세션별 첫 메시지를 ROW_NUMBER로 한 번의 스캔에서 골라냄 (IN 서브쿼리 재조회 제거)
+        query = """
+        WITH firsts AS (
+            SELECT session_id, session_title, content, timestamp,
+                   ROW_NUMBER() OVER (PARTITION BY session_id ORDER BY id) AS rn
+            FROM chat_history
+            WHERE username = ?
+        )
+        SELECT session_id, session_title, content
+        FROM firsts
+        WHERE rn = 1
+        ORDER BY timestamp DESC
+        """
+        sessions = conn.execute(query, (username,)).fetchall()
+        return sessions
 
 def delete_chat_session(username, session_id):
     """특정 채팅 세션을 삭제합니다."""
-    conn = get_db_connection()
-    conn.execute("DELETE FROM chat_history WHERE username = ? AND session_id = ?", (username, session_id))
-    conn.commit()
-    conn.close()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute("DELETE FROM chat_history WHERE username = ? AND session_id = ?", (username, session_id))
 
 def update_chat_session_title(username, session_id, new_title):
     """채팅 세션의 제목을 변경합니다."""
-    conn = get_db_connection()
-    conn.execute(
-        "UPDATE chat_history SET session_title = ? WHERE username = ? AND session_id = ?",
-        (new_title, username, session_id)
-    )
-    conn.commit()
-    conn.close()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute(
+                "UPDATE chat_history SET session_title = ? WHERE username = ? AND session_id = ?",
+                (new_title, username, session_id)
+            )
 
 def get_full_chat_history(username, session_id):
     """
     메시지별 편집/삭제를 위해 id를 포함한 전체 채팅 기록을 가져옵니다.
     """
-    conn = get_db_connection()
-    history = conn.execute(
-        "SELECT id, role, content FROM chat_history WHERE username = ? AND session_id = ? ORDER BY timestamp ASC",
-        (username, session_id)
-    ).fetchall()
-    conn.close()
-    return history
+    with _POOL.borrow() as conn:
+        history = conn.execute(
+            "SELECT id, role, content FROM chat_history WHERE username = ? AND session_id = ? ORDER BY timestamp ASC",
+            (username, session_id)
+        ).fetchall()
+        return history
 
 def update_chat_message(message_id, new_content):
     """특정 채팅 메시지의 내용을 수정합니다."""
-    conn = get_db_connection()
-    conn.execute("UPDATE chat_history SET content = ? WHERE id = ?", (new_content, message_id))
-    conn.commit()
-    conn.close()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute("UPDATE chat_history SET content = ? WHERE id = ?", (new_content, message_id))
 
 def delete_chat_message_and_following(message_id, username, session_id):
     """
     특정 메시지와 그 이후의 모든 메시지를 삭제합니다.
     삭제 후 해당 세션에 남은 메시지가 있는지 여부를 반환합니다.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # ... (삭제 로직은 동일)
-    
-    # 삭제 후, 동일한 세션에 다른 메시지가 남아있는지 확인
-    cursor.execute(
-        "SELECT COUNT(*) FROM chat_history WHERE username = ? AND session_id = ?",
-        (username, session_id)
-    )
-    remaining_messages_count = cursor.fetchone()[0]
-    
-    conn.close()
-    
-    return remaining_messages_count > 0
+    with _POOL.borrow() as conn:
+        cursor = conn.cursor()
+
+        with conn:
+            # 기준 메시지 조회 없이 한 번의 DELETE로 처리 (delete_chat_messages_from과 같이 ID로 비교)
+            cursor.execute(
+                "DELETE FROM chat_history WHERE username = ? AND session_id = ? AND id >= ?",
+                (username, session_id, message_id)
+            )
+
+        # 삭제 후, 동일한 세션에 다른 메시지가 남아있는지 확인
+        cursor.execute(
+            "SELECT COUNT(*) FROM chat_history WHERE username = ? AND session_id = ?",
+            (username, session_id)
+        )
+        remaining_messages_count = cursor.fetchone()[0]
+
+
+        return remaining_messages_count > 0
 
 def delete_single_chat_message(message_id, username, session_id):
     """
     ID를 기반으로 정확히 하나의 채팅 메시지를 삭제합니다.
     삭제 후 해당 세션에 남은 메시지가 있는지 여부를 반환합니다.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    # 메시지 삭제
-    cursor.execute("DELETE FROM chat_history WHERE id = ?", (message_id,))
-    conn.commit()
-    
-    # 삭제 후, 동일한 세션에 다른 메시지가 남아있는지 확인
-    cursor.execute(
-        "SELECT COUNT(*) FROM chat_history WHERE username = ? AND session_id = ?",
-        (username, session_id)
-    )
-    remaining_messages_count = cursor.fetchone()[0]
-    
-    conn.close()
-    
-    # 남은 메시지가 0이면 False, 1 이상이면 True 반환
-    return remaining_messages_count > 0
+    with _POOL.borrow() as conn:
+        cursor = conn.cursor()
+
+        with conn:
+            # 메시지 삭제
+            cursor.execute("DELETE FROM chat_history WHERE id = ?", (message_id,))
+
+        # 삭제 후, 동일한 세션에 다른 메시지가 남아있는지 확인
+        cursor.execute(
+            "SELECT COUNT(*) FROM chat_history WHERE username = ? AND session_id = ?",
+            (username, session_id)
+        )
+        remaining_messages_count = cursor.fetchone()[0]
+
+
+        # 남은 메시지가 0이면 False, 1 이상이면 True 반환
+        return remaining_messages_count > 0
 
 def delete_chat_messages_from(message_id, username, session_id):
     """
     특정 메시지 ID부터 그 이후의 모든 메시지를 해당 세션에서 삭제합니다.
     주로 사용자 질문이 수정되었을 때, 그에 대한 이전 AI 답변들을 지우기 위해 사용됩니다.
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
-
-    # 타임스탬프 대신, ID를 직접 비교하여 기준 ID보다 큰 모든 메시지를 삭제합니다.
-    cursor.execute(
-        "DELETE FROM chat_history WHERE username = ? AND session_id = ? AND id > ?",
-        (username, session_id, message_id)
-    )
-   
-    conn.commit()
-    conn.close()
-    print(f"Session {session_id}: Messages after ID {message_id} deleted.")
+    with _POOL.borrow() as conn:
+        cursor = conn.cursor()
+
+        with conn:
+            # 타임스탬프 대신, ID를 직접 비교하여 기준 ID보다 큰 모든 메시지를 삭제합니다.
+            cursor.execute(
+                "DELETE FROM chat_history WHERE username = ? AND session_id = ? AND id > ?",
+                (username, session_id, message_id)
+            )
+        print(f"Session {session_id}: Messages after ID {message_id} deleted.")
 
 def delete_single_original_question(question_id):
     """
     ID를 기반으로 정확히 하나의 원본 문제를 삭제합니다.
     관련된 모든 사용자의 오답 기록도 함께 삭제합니다.
     """
-    conn = get_db_connection()
-    # 1. 해당 원본 문제에 대한 모든 사용자의 오답 기록 삭제
-    conn.execute("DELETE FROM user_answers WHERE question_id = ? AND question_type = 'original'", (question_id,))
-    
-    # 2. 원본 문제 삭제
-    conn.execute("DELETE FROM original_questions WHERE id = ?", (question_id,))
-    
-    conn.commit()
-    conn.close()
\ No newline at end of file
+    _flush_answer_queue()
+    with _POOL.borrow() as conn:
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # 1. 해당 원본 문제에 대한 모든 사용자의 오답 기록 삭제
+            conn.execute("DELETE FROM user_answers WHERE question_id = ? AND question_type = 'original'", (question_id,))
+
+            # 2. 원본 문제 삭제
+            conn.execute("DELETE FROM original_questions WHERE id = ?", (question_id,))
+        _invalidate_question_cache()
\ No newline at end of file
@@ -6,13 +6,39 @@ Google Gemini API와의 모든 상호작용을 담당하는 모듈.
 import os
 import json
 import re
+import functools
+import itertools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import TypedDict
+import json_utils
 import google.generativeai as genai
 from dotenv import load_dotenv
 from google.api_core import exceptions
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
 # --- Initialization ---
 load_dotenv()
 
+# 난이도 분석/해설 생성을 여러 문제에 대해 한꺼번에 요청할 때 동시에 보낼 최대 요청 수
+# API 요금제의 분당 요청 한도(RPM)에 맞게 .env의 GEMINI_CONCURRENCY로 조정 (예: 무료 3, Tier 1 15, Tier 2 50)
+try:
+    AI_CONCURRENCY = max(1, int(os.environ.get("GEMINI_CONCURRENCY", 8)))
+except ValueError:
+    AI_CONCURRENCY = 8
+
+# JSON으로 답해야 하는 요청(해설, 변형 문제)은 응답 형식을 JSON으로 지정하여 코드 블록이나 설명 텍스트가 섞이지 않게 함
+json_generation_config = {"response_mime_type": "application/json"}
+
+class Explanation(TypedDict):
+    """AI 해설 응답의 JSON 구조"""
+    analogy: str
+    visualization: str
+    core_concepts: str
+
+# 해설은 필드가 고정되어 있으므로 스키마까지 지정하여, 모델이 세 필드를 모두 채운 JSON만 생성하도록 제한
+# (변형 문제의 options는 키(A, B, ...) 개수가 문제마다 달라 스키마 없이 JSON 형식만 지정)
+explanation_generation_config = {**json_generation_config, "response_schema": Explanation}
+
 try:
     api_key = os.environ.get("GEMINI_API_KEY")
     if not api_key:
@@ -33,78 +59,230 @@ except (ValueError, Exception) as e:
     print(f"Gemini API 초기화 오류: {e}")
 
 # --- Helper Functions ---
+_JSON_DECODER = json.JSONDecoder()
+# 줄 맨 앞(들여쓰기 허용)에서 시작하는 '{'
+_JSON_LINE_START_RE = re.compile(r'^[ \t]*(\{)', re.MULTILINE)
+_MAX_JSON_DECODE_ATTEMPTS = 8
+
 def _clean_and_parse_json(raw_text: str):
     """
     AI 응답 텍스트에서 JSON 객체만 안전하게 추출하고 파싱합니다.
-    Markdown 코드 블록(```json ... ```)을 처리합니다.
+    Markdown 코드 블록(```json ... ```)이나 앞뒤 설명 텍스트가 섞여 있어도 처리합니다.
     """
     if not isinstance(raw_text, str): return None
     
-    match = re.search(r'```json\s*(\{.*\})\s*```', raw_text, re.DOTALL)
-    json_text = match.group(1) if match else raw_text
-    
-    try:
-        return json.loads(json_text)
-    except json.JSONDecodeError:
-        # 중괄호로 시작하고 끝나는 부분만 다시 추출 시도
-        start = json_text.find('{')
-        end = json_text.rfind('}')
-        if start != -1 and end != -1:
-            try:
-                return json.loads(json_text[start:end+1])
-            except json.JSONDecodeError:
-                return None
+    # 1. response_mime_type으로 JSON만 오는 것이 정상이므로 바로 파싱
+    text = raw_text.strip()
+    if text.startswith('{'):
+        try:
+            return json_utils.loads(text)
+        except json.JSONDecodeError:
+            pass
+
+    # 2. 예외적인 경우: 첫 '{'부터 완결된 JSON 객체 하나를 읽어 봄 (코드 블록 표시나 뒤에 붙은 텍스트는 무시)
+    #    앞쪽 설명 텍스트의 중괄호 때문에 실패하면, 줄 맨 앞에서 시작하는 '{'(코드 블록 안의 JSON 등)만 차례로 시도
+    #    응답이 깨져 있어도 시간이 오래 걸리지 않도록 시도 횟수를 _MAX_JSON_DECODE_ATTEMPTS로 제한
+    first = text.find('{')
+    if first == -1:
         return None
+    line_starts = (m.start(1) for m in _JSON_LINE_START_RE.finditer(text, first + 1))
+    for start in itertools.islice(itertools.chain((first,), line_starts), _MAX_JSON_DECODE_ATTEMPTS):
+        # '{'에서 시작했으므로 성공하면 항상 dict
+        try:
+            return _JSON_DECODER.raw_decode(text, start)[0]
+        except json.JSONDecodeError:
+            continue
+    return None
 
-# --- Main API Functions ---
-def generate_explanation(question_data: dict) -> dict:
-    """Gemini를 사용하여 문제에 대한 상세한 해설을 생성합니다."""
-    if not model: return {"error": "Gemini API가 설정되지 않았습니다."}
+def _run_concurrently(func, items: list, on_progress=None, on_error=None) -> list:
+    """
+    items 각각에 대해 func(item)을 최대 AI_CONCURRENCY개 스레드에서 동시에 실행하고 결과를 입력 순서대로 반환합니다.
+    on_progress(완료 개수, 전체 개수)가 주어지면 하나가 끝날 때마다 호출합니다. (호출한 스레드에서 실행되므로 Streamlit 요소를 갱신해도 됨)
+    어떤 요청에서 예외가 나도 나머지 결과는 그대로 받으며, 그 자리는 on_error(예외)의 반환값으로 채웁니다.
+    (비동기 클라이언트는 처음 쓴 이벤트 루프에 묶여 배치마다 asyncio.run을 쓰면 다음 배치가 실패하므로, 동기 호출을 스레드로 나눠 실행)
+    """
+    total = len(items)
+    results = [None] * total
+    if not total:
+        return results
+    # API 할당량을 넘지 않도록 동시 요청 수를 제한
+    with ThreadPoolExecutor(max_workers=min(AI_CONCURRENCY, total)) as executor:
+        futures = {executor.submit(func, item): i for i, item in enumerate(items)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                if on_error is None:
+                    raise
+                results[i] = on_error(e)
+            if on_progress:
+                on_progress(done, total)
+    return results
+
+def _api_error_message(e: Exception, action: str) -> str:
+    """API 예외를 사용자에게 보여줄 오류 메시지로 변환합니다."""
+    if isinstance(e, exceptions.InternalServerError):
+        return "AI 서버 내부 오류(500)가 발생했습니다. 잠시 후 다시 시도해주세요."
+    if isinstance(e, exceptions.ResourceExhausted):
+        return "API 사용량 한도를 초과했습니다. Google Cloud 콘솔에서 확인해주세요."
+    return f"{action} 중 예상치 못한 API 오류 발생: {e}"
+
+# 일시적인 서버 오류(500/503)와 사용량 초과(429)는 바로 오류로 돌려주지 않고 몇 번 더 시도
+_RETRYABLE_API_ERRORS = (exceptions.InternalServerError, exceptions.ServiceUnavailable, exceptions.ResourceExhausted)
+# 서버가 알려준 대기 시간이 아무리 길어도 화면이 멈춰 있는 시간은 이 값(초)으로 제한
+_MAX_RETRY_DELAY = 20
+_jittered_backoff = wait_random_exponential(min=1, max=8)
+
+def _retry_wait(retry_state) -> float:
+    """429 응답에 RetryInfo(retry_delay)가 있으면 그만큼 기다리고, 없으면 지터가 섞인 지수 백오프 시간을 사용합니다."""
+    error = retry_state.outcome.exception()
+    for detail in getattr(error, 'details', None) or ():
+        delay = getattr(detail, 'retry_delay', None)
+        if delay is not None:
+            seconds = delay.total_seconds() if hasattr(delay, 'total_seconds') else delay.seconds + delay.nanos / 1e9
+            return min(seconds, _MAX_RETRY_DELAY)
+    return _jittered_backoff(retry_state)
+
+# 마지막 시도까지 실패하면 원래 예외를 그대로 올려 호출부에서 _api_error_message로 변환
+_api_retry = retry(
+    retry=retry_if_exception_type(_RETRYABLE_API_ERRORS),
+    stop=stop_after_attempt(4), wait=_retry_wait, reraise=True,
+)
+
+@_api_retry
+def _generate_content(prompt, **kwargs):
+    return model.generate_content(prompt, safety_settings=safety_settings, **kwargs)
 
+# --- Prompt Templates ---
+# 요청마다 바뀌지 않는 지시문/출력 형식을 앞에 두고 문제 데이터는 맨 뒤에 붙임
+# (모든 요청의 프롬프트 앞부분이 글자 단위로 같아야 Gemini의 암시적 프롬프트 캐시가 적중할 수 있음)
+_EXPLANATION_PROMPT_PREFIX = """You are an instructor known for making students feel confident and smart. Your name is 'Gemini Tutor'.
+Explain the Oracle OCP question given at the end for a beginner.
+Do not use overly complex jargon without explaining it first.
+
+Please structure your explanation in three distinct parts as a JSON object, using Korean:
+1.  "analogy": A simple, easy-to-understand analogy.
+2.  "visualization": A text-based visualization.
+3.  "core_concepts": A clear summary of the key concepts, explaining why the correct answer is right and others are wrong.
+
+**Output Format (Strictly follow this JSON format):**
+{
+  "analogy": "...",
+  "visualization": "...",
+  "core_concepts": "..."
+}
+"""
+
+_MODIFY_PROMPT_PREFIX = """You are an expert Oracle DBA exam question creator. Based on the provided question, create a new, similar one.
+
+**Instructions:**
+- Test the exact same core concept.
+- Change details like table/column names, and values.
+- The output MUST be a valid JSON object and nothing else.
+
+**One-shot Example:**
+**Input:**
+Question: Which query is valid for the EMPLOYEES table?
+Options: {...}
+Correct Answer: ["C"]
+
+**Expected Output (JSON only):**
+{
+  "question": "For the WORKERS table, which of the following SQL statements is correct?",
+  "options": { "A": "...", "B": "...", "C": "...", "D": "...", "E": "..." },
+  "answer": ["B"]
+}
+---
+**Now, process the following real request:**
+"""
+
+@functools.lru_cache(maxsize=1024)
+def _format_options_and_answer(options_json: str, answer_json: str):
+    """
+    DB에 저장된 options/answer JSON을 프롬프트용 (선택지 줄 목록 문자열, 정답 리스트)로 변환합니다.
+    같은 문제로 해설/변형을 여러 번 요청해도 다시 파싱하지 않도록 JSON 문자열을 키로 캐시합니다.
+    """
+    options = json_utils.loads(options_json)
+    answer = json_utils.loads(answer_json)
+    return "\n".join([f"{key}. {value}" for key, value in options.items()]), answer
+
+# --- Main API Functions ---
+def _build_explanation_prompt(question_data: dict):
+    """해설 생성 프롬프트를 만듭니다. 문제 데이터가 잘못되었으면 (None, 오류 dict)를 반환합니다."""
     try:
         question_text = question_data['question']
-        options = json.loads(question_data['options'])
-        answer = json.loads(question_data['answer'])
-        options_str = "\n".join([f"{key}. {value}" for key, value in options.items()])
-    except (json.JSONDecodeError, TypeError, KeyError) as e:
-        return {"error": f"해설 생성을 위한 문제 데이터 파싱 오류: {e}"}
+        options_str, answer = _format_options_and_answer(question_data['options'], question_data['answer'])
+    except (json.JSONDecodeError, TypeError, KeyError, AttributeError) as e:
+        return None, {"error": f"해설 생성을 위한 문제 데이터 파싱 오류: {e}"}
 
-    prompt = f"""
-    You are an instructor known for making students feel confident and smart. Your name is 'Gemini Tutor'.
-    Explain the following Oracle OCP question for a beginner. The correct answer is {answer}.
-    Do not use overly complex jargon without explaining it first.
+    prompt = _EXPLANATION_PROMPT_PREFIX + f"""
+**Question:**
+{question_text}
+**Options:**
+{options_str}
+**Correct Answer:** {answer}
+"""
+    return prompt, None
 
-    **Question:**
-    {question_text}
-    **Options:**
-    {options_str}
-
-    Please structure your explanation in three distinct parts as a JSON object, using Korean:
-    1.  "analogy": A simple, easy-to-understand analogy.
-    2.  "visualization": A text-based visualization.
-    3.  "core_concepts": A clear summary of the key concepts, explaining why the correct answer is right and others are wrong.
-
-    **Output Format (Strictly follow this JSON format):**
-    {{
-      "analogy": "...",
-      "visualization": "...",
-      "core_concepts": "..."
-    }}
+def _parse_explanation_response(response_text: str) -> dict:
+    parsed_json = _clean_and_parse_json(response_text)
+    if parsed_json:
+        return parsed_json
+    return {"error": f"AI 응답에서 유효한 JSON을 파싱하지 못했습니다. 원본 응답:\n---\n{response_text}\n---"}
+
+# 스트리밍 중인(아직 닫히지 않은) JSON에서 해설 필드의 문자열 값을 지금까지 받은 만큼 읽어냄
+_PARTIAL_FIELD_RE = re.compile(r'"(analogy|visualization|core_concepts)"\s*:\s*"((?:[^"\\]|\\.)*)')
+# 값 끝에서 잘린 이스케이프 시퀀스. 끝의 백슬래시 개수가 홀수일 때만 해당하며, 앞쪽의 완결된 \\ 쌍은 그대로 둠
+_PARTIAL_ESCAPE_RE = re.compile(r'(?<!\\)((?:\\\\)*)\\(u[0-9a-fA-F]{0,3})?$')
+
+def _partial_explanation_fields(partial_text: str) -> dict:
+    """스트리밍 도중의 불완전한 JSON 텍스트에서 지금까지 도착한 해설 필드들을 {필드: 부분 문자열}로 반환합니다."""
+    fields = {}
+    for name, raw_value in _PARTIAL_FIELD_RE.findall(partial_text):
+        # 이스케이프 시퀀스(\n, \uXXXX 등)가 청크 경계에서 잘렸으면 그 부분은 다음 청크에서 처리
+        raw_value = _PARTIAL_ESCAPE_RE.sub(r'\1', raw_value)
+        try:
+            fields[name] = json.loads(f'"{raw_value}"')
+        except json.JSONDecodeError:
+            continue
+    return fields
+
+def generate_explanation(question_data: dict, on_partial=None) -> dict:
     """
+    Gemini를 사용하여 문제에 대한 상세한 해설을 생성합니다.
+    on_partial이 주어지면 응답을 스트리밍으로 받으며, 청크가 도착할 때마다 지금까지의 해설 필드 dict로 호출합니다.
+    """
+    if not model: return {"error": "Gemini API가 설정되지 않았습니다."}
+
+    prompt, error = _build_explanation_prompt(question_data)
+    if error: return error
     
     try:
-        response = model.generate_content(prompt, safety_settings=safety_settings)
-        parsed_json = _clean_and_parse_json(response.text)
-        if parsed_json:
-            return parsed_json
-        return {"error": f"AI 응답에서 유효한 JSON을 파싱하지 못했습니다. 원본 응답:\n---\n{response.text}\n---"}
-
-    except exceptions.InternalServerError as e:
-        return {"error": f"AI 서버 내부 오류(500)가 발생했습니다. 잠시 후 다시 시도해주세요."}
-    except exceptions.ResourceExhausted as e:
-        return {"error": f"API 사용량 한도를 초과했습니다. Google Cloud 콘솔에서 확인해주세요."}
+        if on_partial is None:
+            response = _generate_content(prompt, generation_config=explanation_generation_config)
+            return _parse_explanation_response(response.text)
+
+        response_text = ""
+        for chunk in _generate_content(prompt, generation_config=explanation_generation_config, stream=True):
+            response_text += chunk.text
+            partial = _partial_explanation_fields(response_text)
+            if partial:
+                on_partial(partial)
+        return _parse_explanation_response(response_text)
     except Exception as e:
-        return {"error": f"해설 생성 중 예상치 못한 API 오류 발생: {e}"}
+        return {"error": _api_error_message(e, "해설 생성")}
+
+def generate_explanations_batch(questions: list, on_progress=None) -> list:
+    """
+    여러 문제의 해설을 동시에 생성하여 입력 순서대로 반환합니다. (각 항목은 generate_explanation과 같은 형식)
+    문제마다 순차로 응답을 기다리지 않으므로 전체 대기 시간이 가장 느린 몇 개의 요청 수준으로 줄어듭니다.
+    """
+    if not model: return [{"error": "Gemini API가 설정되지 않았습니다."} for _ in questions]
+    return _run_concurrently(
+        generate_explanation, questions, on_progress,
+        on_error=lambda e: {"error": _api_error_message(e, "해설 생성")}
+    )
 
 
 def generate_modified_question(original_question_data: dict) -> dict:
@@ -113,45 +291,21 @@ def generate_modified_question(original_question_data: dict) -> dict:
     
     try:
         question_text = original_question_data['question']
-        options = json.loads(original_question_data['options'])
-        answer = json.loads(original_question_data['answer'])
-        options_str = "\n".join([f"{key}. {value}" for key, value in options.items()])
-    except (json.JSONDecodeError, TypeError, KeyError) as e:
+        options_str, answer = _format_options_and_answer(original_question_data['options'], original_question_data['answer'])
+    except (json.JSONDecodeError, TypeError, KeyError, AttributeError) as e:
         return {"error": f"문제 변형을 위한 원본 데이터 파싱 오류: {e}"}
 
-    prompt = f"""
-    You are an expert Oracle DBA exam question creator. Based on the provided question, create a new, similar one.
-    
-    **Instructions:**
-    - Test the exact same core concept.
-    - Change details like table/column names, and values.
-    - The output MUST be a valid JSON object and nothing else.
-    
-    **One-shot Example:**
-    **Input:**
-    Question: Which query is valid for the EMPLOYEES table?
-    Options: {{...}}
-    Correct Answer: ["C"]
-    
-    **Expected Output (JSON only):**
-    {{
-      "question": "For the WORKERS table, which of the following SQL statements is correct?",
-      "options": {{ "A": "...", "B": "...", "C": "...", "D": "...", "E": "..." }},
-      "answer": ["B"]
-    }}
-    ---
-    **Now, process the following real request:**
-    **Input:**
-    Question: {question_text}
-    Options:
-    {options_str}
-    Correct Answer: {answer}
-
-    **Expected Output (JSON only):**
-    """
+    prompt = _MODIFY_PROMPT_PREFIX + f"""**Input:**
+Question: {question_text}
+Options:
+{options_str}
+Correct Answer: {answer}
+
+**Expected Output (JSON only):**
+"""
     
     try:
-        response = model.generate_content(prompt, safety_settings=safety_settings)
+        response = _generate_content(prompt, generation_config=json_generation_config)
         parsed_json = _clean_and_parse_json(response.text)
         
         if not parsed_json:
@@ -165,22 +319,12 @@ def generate_modified_question(original_question_data: dict) -> dict:
 
         return parsed_json
  
-    except exceptions.InternalServerError as e:
-        return {"error": f"AI 서버 내부 오류(500)가 발생했습니다. 잠시 후 다시 시도해주세요."}
-    except exceptions.ResourceExhausted as e:
-        return {"error": f"API 사용량 한도를 초과했습니다. Google Cloud 콘솔에서 확인해주세요."}
     except Exception as e:
-        return {"error": f"문제 변형 중 예상치 못한 API 오류 발생: {e}"}
-
-def analyze_difficulty(question_text: str) -> str:
-    """
-    Gemini를 사용하여 문제 텍스트를 분석하고 난이도를 '쉬움', '보통', '어려움' 중 하나로 추정합니다.
-    """
-    if not model:
-        print("Warning: Gemini API not configured. Defaulting difficulty to '보통'.")
-        return '보통'
+        return {"error": _api_error_message(e, "문제 변형")}
 
-    prompt = f"""
+def _build_difficulty_prompt(question_text: str) -> str:
+    """난이도 분석 프롬프트를 만듭니다."""
+    return f"""
     Analyze the difficulty of the following Oracle OCP exam question.
     Consider factors like complexity of the SQL query, subtlety of the concept, number of components involved, and depth of knowledge required.
     
@@ -194,20 +338,44 @@ def analyze_difficulty(question_text: str) -> str:
 
     **Difficulty (쉬움, 보통, or 어려움):**
     """
-    
+
+def _normalize_difficulty(raw_text: str) -> str:
+    """응답 텍스트를 '쉬움', '보통', '어려움' 중 하나로 정리합니다."""
+    # 응답 텍스트에서 앞뒤 공백을 제거
+    difficulty = raw_text.strip()
+    # 예상 답변 외의 값이 나오면 '보통'으로 강제
+    if difficulty not in ['쉬움', '보통', '어려움']:
+        return '보통'
+    return difficulty
+
+def analyze_difficulty(question_text: str, default='보통') -> str:
+    """
+    Gemini를 사용하여 문제 텍스트를 분석하고 난이도를 '쉬움', '보통', '어려움' 중 하나로 추정합니다.
+    분석에 실패하면 default를 반환합니다.
+    """
+    if not model:
+        print("Warning: Gemini API not configured. Defaulting difficulty to '보통'.")
+        return default
+
     try:
-        response = model.generate_content(prompt, safety_settings=safety_settings)
-        # 응답 텍스트에서 앞뒤 공백을 제거
-        difficulty = response.text.strip()
-        
-        # 예상 답변 외의 값이 나오면 '보통'으로 강제
-        if difficulty not in ['쉬움', '보통', '어려움']:
-            return '보통'
-        return difficulty
+        response = _generate_content(_build_difficulty_prompt(question_text))
+        return _normalize_difficulty(response.text)
         
     except Exception as e:
         print(f"Difficulty analysis failed for a question: {e}")
-        return '보통' # 오류 발생 시 기본값 반환
+        return default # 오류 발생 시 기본값 반환
+
+def analyze_difficulty_batch(question_texts: list, on_progress=None, default='보통') -> list:
+    """
+    여러 문제의 난이도를 동시에 분석하여 입력 순서대로 반환합니다.
+    문제마다 순차로 API를 기다리지 않으므로 전체 소요 시간이 크게 줄어듭니다.
+    on_progress(완료 개수, 전체 개수)가 주어지면 각 문제 분석이 끝날 때마다 호출합니다.
+    분석에 실패한 문제는 default 값으로 채웁니다. (None을 주면 실패 여부를 구분할 수 있음)
+    """
+    if not model:
+        print("Warning: Gemini API not configured. Defaulting difficulty to '보통'.")
+        return [default] * len(question_texts)
+    return _run_concurrently(lambda text: analyze_difficulty(text, default), question_texts, on_progress, on_error=lambda e: default)
 
 def get_chat_response(history: list, question: str) -> str:
     """
@@ -217,8 +385,8 @@ def get_chat_response(history: list, question: str) -> str:
         return "Gemini API가 설정되지 않았습니다."
 
     try:
-        chat_model = genai.GenerativeModel('gemini-flash-lite-latest')
-        chat = chat_model.start_chat(history=history)
+        # 모듈 수준에서 만든 같은 모델을 재사용 (호출마다 GenerativeModel을 새로 만들지 않음)
+        chat = model.start_chat(history=history)
         response = chat.send_message(question)
         return response.text
     except Exception as e:
@@ -248,7 +416,7 @@ def generate_session_title(history: list) -> str:
     """
 
     try:
-        response = model.generate_content(prompt, safety_settings=safety_settings)
+        response = _generate_content(prompt)
         # 응답에서 불필요한 문자(따옴표, 별표 등) 제거
         title = response.text.strip().replace("*", "").replace("\"", "").replace("'", "")
         return title if title else "대화 요약"
@@ -0,0 +1,22 @@
+# json_utils.py
+"""
+여러 모듈에서 공통으로 쓰는 JSON 직렬화/역직렬화 함수를 모아놓은 모듈.
+orjson(C 구현)이 설치되어 있으면 사용하고, 없으면 표준 json으로 대체합니다.
+orjson.JSONDecodeError는 json.JSONDecodeError의 하위 클래스이므로 호출부의 기존 except 절은 그대로 동작합니다.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def dumps(obj) -> str:
+    """한글을 이스케이프하지 않고 공백 없이 직렬화합니다. (DB 저장용)"""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode()
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def loads(raw):
+    """JSON 문자열(또는 bytes)을 파이썬 객체로 변환합니다."""
+    return orjson.loads(raw) if orjson else json.loads(raw)
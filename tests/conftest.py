@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+# 저장소 루트의 모듈(db_utils 등)을 패키지 설치 없이 임포트
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """임시 파일 DB를 쓰는 연결 풀로 바꾼 db_utils 모듈을 돌려줍니다."""
+    import db_utils
+
+    monkeypatch.setattr(db_utils, "_POOL", db_utils.ConnectionPool(str(tmp_path / "test.db")))
+    db_utils._invalidate_question_cache()
+    db_utils.setup_database_tables()
+    yield db_utils
+    db_utils._POOL.close()
+    db_utils._invalidate_question_cache()
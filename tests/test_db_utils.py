@@ -0,0 +1,98 @@
+import contextlib
+import json
+import sqlite3
+
+import pytest
+
+
+def _question(q_id=None, text="Which statement is true?"):
+    q = {"question": text, "options": {"A": "one", "B": "two"}, "answer": ["A"], "difficulty": "보통"}
+    if q_id is not None:
+        q["id"] = q_id
+    return q
+
+
+@contextlib.contextmanager
+def _write_locked(db):
+    """다른 연결이 쓰기 잠금을 잡고 있는 상태를 만듭니다."""
+    with db._POOL.borrow() as conn:
+        # 잠긴 DB에서 기본 5초를 기다리지 않도록 (풀에는 이 연결 하나뿐)
+        conn.execute("PRAGMA busy_timeout = 50")
+        db_path = conn.execute("PRAGMA database_list").fetchone()["file"]
+    blocker = sqlite3.connect(db_path, isolation_level=None)
+    blocker.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    finally:
+        blocker.rollback()
+        blocker.close()
+
+
+def test_load_questions_without_id_keeps_inserted_rows(db):
+    count, error = db.load_original_questions_from_json([_question(text="first"), _question(text="second")])
+
+    assert (count, error) == (2, None)
+    with db._POOL.borrow() as conn:
+        rows = conn.execute("SELECT question FROM original_questions ORDER BY id").fetchall()
+    assert [row["question"] for row in rows] == ["first", "second"]
+
+
+def test_load_questions_prunes_rows_missing_from_input(db):
+    db.load_original_questions_from_json([_question(1), _question(2)])
+    db.load_original_questions_from_json([_question(2), _question(text="new")])
+
+    with db._POOL.borrow() as conn:
+        ids = [row["id"] for row in conn.execute("SELECT id FROM original_questions ORDER BY id")]
+    assert ids[0] == 2
+    assert len(ids) == 2
+
+
+def test_load_questions_restores_synchronous_when_db_is_locked(db):
+    with _write_locked(db), pytest.raises(sqlite3.OperationalError):
+        db.load_original_questions_from_json([_question(1)])
+
+    with db._POOL.borrow() as conn:
+        # NORMAL = 1
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1
+
+
+def test_answers_survive_a_failed_flush(db):
+    with _write_locked(db), pytest.raises(sqlite3.OperationalError):
+        db._answer_queue.put(("alice", 1, "original", '["A"]', False, "2024-01-01 00:00:00"))
+        db._flush_answer_queue()
+
+    db._flush_answer_queue()
+    with db._POOL.borrow() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM user_answers WHERE username = 'alice'").fetchone()[0] == 1
+
+
+def test_schema_upgrade_keeps_explanations_for_unchanged_questions(db):
+    question = _question(1, text="같은 문제")
+    with db._POOL.borrow() as conn, conn:
+        # 예전 버전처럼 json.dumps 기본 형식(공백, 한글 이스케이프)으로 저장된 행
+        conn.execute(
+            "INSERT INTO original_questions (id, question, options, answer) VALUES (1, ?, ?, ?)",
+            (question["question"], json.dumps({"A": "하나", "B": "two"}), json.dumps(["A"])),
+        )
+        conn.execute("INSERT INTO ai_explanations (question_id, question_type, explanation) VALUES (1, 'original', '{}')")
+        conn.execute("PRAGMA user_version = 4")
+
+    db.setup_database_tables()
+    db.load_original_questions_from_json([dict(question, options={"A": "하나", "B": "two"})])
+    assert db.get_ai_explanation_from_db(1, "original") is not None
+
+    db.load_original_questions_from_json([dict(question, options={"A": "바뀐 선택지", "B": "two"})])
+    assert db.get_ai_explanation_from_db(1, "original") is None
+
+
+def test_load_questions_without_id_across_chunks_are_not_overwritten(db, monkeypatch):
+    monkeypatch.setattr(db, "LOAD_CHUNK_SIZE", 2)
+    # 첫 청크의 id 없는 문제가 먼저 삽입되면 id 3을 받아, 두 번째 청크의 id 3 문제에 덮어써짐
+    db.load_original_questions_from_json([_question(1), _question(2)])
+    db.load_original_questions_from_json([_question(1), _question(text="no id"), _question(3), _question(2)])
+
+    with db._POOL.borrow() as conn:
+        rows = conn.execute("SELECT id, question FROM original_questions ORDER BY id").fetchall()
+    assert [(row["id"], row["question"]) for row in rows] == [
+        (1, "Which statement is true?"), (2, "Which statement is true?"), (3, "Which statement is true?"), (4, "no id"),
+    ]
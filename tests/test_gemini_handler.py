@@ -0,0 +1,88 @@
+import threading
+
+import pytest
+
+gemini_handler = pytest.importorskip("gemini_handler", exc_type=ImportError)
+
+
+class _FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FakeModel:
+    """generate_content 호출을 기록하고 고정된 응답을 돌려주는 모델."""
+
+    def __init__(self, text):
+        self.text = text
+        self.threads = set()
+
+    def generate_content(self, prompt, **kwargs):
+        self.threads.add(threading.get_ident())
+        if self.text is None:
+            raise RuntimeError("API down")
+        return _FakeResponse(self.text)
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    model = _FakeModel('{"analogy": "a", "visualization": "v", "core_concepts": "c"}')
+    monkeypatch.setattr(gemini_handler, "model", model)
+    monkeypatch.setattr(gemini_handler, "safety_settings", [], raising=False)
+    return model
+
+
+def _question(q_id):
+    return {"id": q_id, "question": f"question {q_id}", "options": '{"A": "x", "B": "y"}', "answer": '["A"]'}
+
+
+def test_explanation_batches_run_back_to_back(fake_model):
+    progress = []
+    first = gemini_handler.generate_explanations_batch([_question(1), _question(2)])
+    second = gemini_handler.generate_explanations_batch(
+        [_question(3), _question(4), _question(5)], on_progress=lambda done, total: progress.append((done, total))
+    )
+
+    expected = {"analogy": "a", "visualization": "v", "core_concepts": "c"}
+    assert first == [expected] * 2
+    assert second == [expected] * 3
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    assert threading.get_ident() not in fake_model.threads
+
+
+def test_difficulty_batches_run_back_to_back(fake_model):
+    fake_model.text = "어려움"
+    assert gemini_handler.analyze_difficulty_batch(["q1", "q2"]) == ["어려움", "어려움"]
+    fake_model.text = None
+    assert gemini_handler.analyze_difficulty_batch(["q1", "q2"], default=None) == [None, None]
+
+
+def test_parse_json_skips_braces_in_leading_prose():
+    raw = 'Use {curly} placeholders like {this}.\n```json\n{"analogy": "a", "visualization": "{v}", "core_concepts": "c"}\n```'
+    assert gemini_handler._clean_and_parse_json(raw) == {"analogy": "a", "visualization": "{v}", "core_concepts": "c"}
+    assert gemini_handler._clean_and_parse_json("no json {here}") is None
+
+
+@pytest.mark.parametrize("fragment, expected", [
+    ('{"analogy": "C:\\\\', "C:\\"),           # 완결된 \\ 로 끝남
+    ('{"analogy": "line\\', "line"),           # 잘린 \
+    ('{"analogy": "a\\\\\\', "a\\"),           # \\ 다음에 잘린 \
+    ('{"analogy": "\\uc548\\uc5', "\uc548"),  # 잘린 \uXXXX
+])
+def test_partial_fields_trim_only_incomplete_escapes(fragment, expected):
+    assert gemini_handler._partial_explanation_fields(fragment) == {"analogy": expected}
+
+
+def test_parse_json_caps_decode_attempts(monkeypatch):
+    calls = []
+    decoder = gemini_handler._JSON_DECODER
+
+    class _CountingDecoder:
+        def raw_decode(self, text, start):
+            calls.append(start)
+            return decoder.raw_decode(text, start)
+
+    monkeypatch.setattr(gemini_handler, "_JSON_DECODER", _CountingDecoder())
+    raw = "prose with {braces} " * 500 + "\n{broken\n" * 500 + '\n{"analogy": "late"}'
+    assert gemini_handler._clean_and_parse_json(raw) is None
+    assert len(calls) == gemini_handler._MAX_JSON_DECODE_ATTEMPTS
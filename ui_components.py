@@ -5,58 +5,73 @@ Streamlit UI 컴포넌트를 생성하는 함수들을 모아놓은 모듈.
 """
 import streamlit as st
 # Do NOT call st.set_page_config or inject viewport meta here — keep those only in app.py.
-# --- CSS Injection ---
-# 앱 전체에 적용될 커스텀 CSS 스타일을 한 번만 주입합니다.
-# 이 코드는 파일이 임포트될 때 한 번만 실행됩니다.
-# --- Minimal, safer CSS for iPhone Safari ---
-try:
-    st.markdown(
-        """<style>
-        /* Minimal stable CSS for iOS Safari: avoid transitions/animations and heavy fixed positioning */
-        html, body, .main, .block-container { min-height: 100vh; -webkit-text-size-adjust: 100%; }
-        /* disable tap highlight and avoid transitions that trigger repaints */
-        * { -webkit-tap-highlight-color: rgba(0,0,0,0); -webkit-transition: none !important; transition: none !important; animation: none !important; }
-        /* keep buttons native-like and avoid forcing full repaint */
-        div[data-testid="stButton"] > button { touch-action: manipulation; -webkit-user-select: text; }
-        /* modal containers: avoid full-screen fixed overlays that can conflict with iOS viewport */
-        [data-modal-container], .stModal, .modal { position: relative !important; overflow: visible !important; background: transparent !important; }
-        [data-modal-container] > div, .stModal > div { max-width: 920px; width: calc(100% - 2rem); max-height: calc(100vh - 4rem); overflow: auto; background: #fff; padding: 1rem; border-radius: 8px; margin: 1rem auto; -webkit-overflow-scrolling: touch; }
-        body { padding-bottom: env(safe-area-inset-bottom, 0); padding-top: env(safe-area-inset-top, 0); }
-        </style>""",
-        unsafe_allow_html=True,
-    )
-except Exception as e:
-    print("UI CSS injection failed:", e)
-
 import json
 import os
-from db_utils import get_question_by_id, save_user_answer
+import functools
+import json_utils
+from db_utils import get_questions_by_ids, save_user_answer
+
+# --- CSS Injection ---
+# 앱 전체에 적용될 커스텀 CSS 스타일 (Minimal, safer CSS for iPhone Safari)
+_APP_CSS = """<style>
+/* Minimal stable CSS for iOS Safari: avoid transitions/animations and heavy fixed positioning */
+html, body, .main, .block-container { min-height: 100vh; -webkit-text-size-adjust: 100%; }
+/* disable tap highlight and avoid transitions that trigger repaints */
+* { -webkit-tap-highlight-color: rgba(0,0,0,0); -webkit-transition: none !important; transition: none !important; animation: none !important; }
+/* keep buttons native-like and avoid forcing full repaint */
+div[data-testid="stButton"] > button { touch-action: manipulation; -webkit-user-select: text; }
+/* show quiz radio options as full-width tappable cards */
+div[data-testid="stRadio"] label { width: 100%; padding: 0.6rem 0.8rem; margin-bottom: 0.4rem; border: 1px solid rgba(49,51,63,0.2); border-radius: 8px; touch-action: manipulation; }
+/* modal containers: avoid full-screen fixed overlays that can conflict with iOS viewport */
+[data-modal-container], .stModal, .modal { position: relative !important; overflow: visible !important; background: transparent !important; }
+[data-modal-container] > div, .stModal > div { max-width: 920px; width: calc(100% - 2rem); max-height: calc(100vh - 4rem); overflow: auto; background: #fff; padding: 1rem; border-radius: 8px; margin: 1rem auto; -webkit-overflow-scrolling: touch; }
+body { padding-bottom: env(safe-area-inset-bottom, 0); padding-top: env(safe-area-inset-top, 0); }
+</style>"""
+
+def inject_css():
+    """
+    커스텀 CSS를 페이지에 주입합니다. app.py에서 set_page_config 직후 매 실행마다 호출해야 합니다.
+    Streamlit은 이번 실행에서 그려지지 않은 요소를 화면에서 지우므로, 임포트 시 한 번만 주입하면 첫 rerun부터 스타일이 사라집니다.
+    """
+    st.markdown(_APP_CSS, unsafe_allow_html=True)
+
+# 결과 화면에서 한 페이지에 표시할 문제 카드 수
+RESULTS_PAGE_SIZE = 10
 
 # --- Helper Functions ---
-def _handle_choice_selection(choice_key, answer_count):
-    """선택지 클릭 시 호출되는 콜백. 사용자의 답변을 세션 상태에 업데이트합니다."""
-    idx = st.session_state.current_question_index
-    user_answers = st.session_state.user_answers.get(idx, [])
-
-    if answer_count > 1: # 다중 선택
-        if choice_key in user_answers: user_answers.remove(choice_key)
-        else: user_answers.append(choice_key)
-    else: # 단일 선택
-        user_answers = [choice_key]
-    
-    st.session_state.user_answers[idx] = user_answers
+@st.cache_data(ttl=300, show_spinner=False)
+def media_exists(path: str) -> bool:
+    """
+    미디어 파일 존재 여부를 확인합니다. rerun마다 파일 시스템을 조회하지 않도록 경로별로 5분간 캐시합니다.
+    새 파일을 저장한 뒤에는 media_exists.clear()로 캐시를 비워야 바로 반영됩니다.
+    """
+    return os.path.exists(path)
 
+@functools.lru_cache(maxsize=1024)
+def _parse_options_and_answer(options_json, answer_json):
+    """
+    문제의 options/answer JSON을 (선택지 dict, 정렬된 정답 tuple)로 변환합니다.
+    버튼을 누를 때마다 일어나는 rerun에서 같은 문제를 다시 파싱하지 않도록 JSON 문자열 자체를 키로 캐시합니다.
+    (문제가 수정되면 문자열이 달라지므로 별도의 무효화가 필요 없음. 캐시된 dict는 수정하지 말 것)
+    """
+    try:
+        return json_utils.loads(options_json), tuple(sorted(json_utils.loads(answer_json)))
+    except (json.JSONDecodeError, TypeError):
+        return {}, ()
 
 # --- Main UI Functions ---
+@st.fragment
 def display_question(question_data: dict, current_idx: int, total_questions: int):
     """
-    클릭 가능한 '카드' 형태의 선택지를 포함한 퀴즈 문제를 표시합니다.
+    퀴즈 문제와 선택지를 표시합니다.
+    정답이 하나면 st.radio, 여러 개면 st.multiselect 하나로 선택지를 받아 st.session_state.user_answers에 반영합니다.
+    fragment이므로 선택지를 고를 때는 이 문제 영역만 다시 실행됩니다. (이전/다음 버튼은 fragment 밖에 있어 전체 rerun)
     """
     st.subheader(f"문제 {current_idx + 1}/{total_questions} (ID: {question_data['id']})")
     st.markdown(question_data['question'], unsafe_allow_html=True)
     
     media_url = question_data.get('media_url')
-    if media_url and os.path.exists(media_url):
+    if media_url and media_exists(media_url):
         media_type = question_data.get('media_type')
         if media_type == 'image': 
             st.image(media_url)
@@ -65,71 +80,170 @@ def display_question(question_data: dict, current_idx: int, total_questions: int
     
     st.write("---")
    
-    try:
-        options = json.loads(question_data['options'])
-        answer_count = len(json.loads(question_data['answer'])) or 1
-    except (json.JSONDecodeError, TypeError):
-        options, answer_count = {}, 1
+    options, correct_answer = _parse_options_and_answer(question_data['options'], question_data['answer'])
+    answer_count = len(correct_answer) or 1
 
-    st.info(f"**정답 {answer_count}개를 고르세요.**" + (" (다시 클릭하면 해제)" if answer_count > 1 else ""))
-    
-    user_selection = st.session_state.user_answers.get(current_idx, [])
+    st.info(f"**정답 {answer_count}개를 고르세요.**")
     
-    for key, value in options.items():
-        is_selected = key in user_selection
-        st.button(
-            label=f"{key}. {value}", 
-            key=f"choice_{key}_{current_idx}", 
-            use_container_width=True,
-            type="primary" if is_selected else "secondary",
-            on_click=_handle_choice_selection,
-            args=(key, answer_count)
+    user_selection = st.session_state.user_answers.get(current_idx, set())
+    option_keys = list(options)
+    widget_key = f"choice_{current_idx}_{question_data['id']}"
+    # 다른 문제로 이동했다 돌아오면 위젯 상태가 사라지므로, 저장해 둔 답으로 위젯 값을 다시 채움
+    # (default/index 인자로 넘기면 값이 바뀔 때마다 위젯이 새로 만들어지므로 세션 상태로 초기화)
+    if widget_key not in st.session_state:
+        if answer_count > 1:
+            st.session_state[widget_key] = [k for k in option_keys if k in user_selection]
+        else:
+            st.session_state[widget_key] = next((k for k in option_keys if k in user_selection), None)
+
+    format_option = lambda k: f"{k}. {options[k]}"
+    if answer_count > 1:
+        selected = st.multiselect(
+            "선택지", option_keys, key=widget_key, format_func=format_option,
+            max_selections=answer_count, label_visibility="collapsed", placeholder="답을 고르세요"
+        )
+        st.session_state.user_answers[current_idx] = set(selected)
+    else:
+        selected = st.radio(
+            "선택지", option_keys, index=None, key=widget_key, format_func=format_option,
+            label_visibility="collapsed"
         )
+        st.session_state.user_answers[current_idx] = {selected} if selected is not None else set()
 
 
-def display_results(username: str, get_ai_explanation_func):
-    """퀴즈 결과를 요약하고, 각 문제에 대한 상세 정보를 표시합니다."""
-    
-    st.header("📊 퀴즈 결과")
+def _render_explanation(explanation: dict):
+    """AI 해설의 세 부분을 표시합니다. (스트리밍 중이면 아직 도착한 부분만 표시)"""
+    if 'analogy' in explanation:
+        st.info(f"**💡 쉬운 비유:**\n\n{explanation['analogy']}")
+    if 'visualization' in explanation:
+        st.info(f"**🖼️ 텍스트 시각화:**\n\n```\n{explanation['visualization']}\n```")
+    if 'core_concepts' in explanation:
+        st.info(f"**🔑 핵심 개념:**\n\n{explanation['core_concepts']}")
+
+def _grade_quiz(username: str):
+    """
+    현재 퀴즈를 채점하여 st.session_state.graded_results/correct_count에 저장하고, 틀린 문제를 오답 기록으로 남깁니다.
+    결과 화면에 처음 들어왔을 때 한 번만 실행되며, 이후 rerun에서는 저장된 채점 결과를 그대로 사용합니다.
+    """
+    graded_results = []
     correct_count = 0
-    
+
+    # 결과에 필요한 문제를 한 번에 조회
+    questions = get_questions_by_ids((q_info['id'], q_info['type']) for q_info in st.session_state.questions_to_solve)
     for i, q_info in enumerate(st.session_state.questions_to_solve):
-        question = get_question_by_id(q_info['id'], q_info['type'])
+        question = questions.get((q_info['id'], q_info['type']))
         if not question:
-            st.warning(f"결과 표시 중 문제(ID: {q_info['id']})를 찾을 수 없습니다.")
+            graded_results.append({'q_info': q_info, 'question': None})
             continue
 
-        try:
-            options = json.loads(question['options'])
-            correct_answer = sorted(json.loads(question['answer']))
-        except (json.JSONDecodeError, TypeError):
-            options, correct_answer = {}, []
-
-        user_answer = sorted(st.session_state.user_answers.get(i, []))
-        is_correct = (user_answer == correct_answer and correct_answer != [])
-
-        with st.expander(f"문제 {i+1} (ID: {question['id']}): {'✅ 정답' if is_correct else '❌ 오답'}", expanded=not is_correct):
-            st.markdown(question['question'], unsafe_allow_html=True)
-            st.write("**정답:**", ", ".join(correct_answer))
-            st.write("**나의 답:**", ", ".join(user_answer) if user_answer else "선택 안 함")
-            
-            if st.button("🤖 AI 해설 보기", key=f"exp_{q_info['id']}_{i}"):
-                with st.spinner("AI 튜터가 해설을 만들고 있어요..."):
-                    explanation = get_ai_explanation_func(q_info['id'], q_info['type'])
-                    error_msg = explanation.get('error') if explanation else "해설을 가져오지 못했습니다."
-                    if error_msg:
-                        st.error(error_msg)
-                    else:
-                        st.info(f"**💡 쉬운 비유:**\n\n{explanation.get('analogy', 'N/A')}")
-                        st.info(f"**🖼️ 텍스트 시각화:**\n\n```\n{explanation.get('visualization', 'N/A')}\n```")
-                        st.info(f"**🔑 핵심 개념:**\n\n{explanation.get('core_concepts', 'N/A')}")
-                        
+        _, correct_answer = _parse_options_and_answer(question['options'], question['answer'])
+        user_selection = st.session_state.user_answers.get(i, set())
+        # 선택은 이미 set이므로 정렬 없이 집합으로 비교 (정렬된 목록은 표시/오답 저장용으로만 만듦)
+        is_correct = bool(correct_answer) and user_selection == set(correct_answer)
+        user_answer = sorted(user_selection)
+
         if is_correct:
             correct_count += 1
         else:
             save_user_answer(username, q_info['id'], q_info['type'], user_answer, is_correct=False)
+        graded_results.append({
+            'q_info': q_info, 'question': question, 'is_correct': is_correct,
+            'correct_answer': correct_answer, 'user_answer': user_answer,
+        })
+
+    st.session_state.graded_results = graded_results
+    st.session_state.correct_count = correct_count
+
+@st.fragment
+def _render_result_card(i: int, result: dict, get_ai_explanation_func):
+    """
+    채점된 문제 하나의 결과 카드를 그립니다.
+    fragment로 분리되어 있어 카드 안의 'AI 해설 보기' 버튼을 눌러도 이 카드만 다시 실행됩니다.
+    """
+    shown_explanations = st.session_state.shown_explanations
+    q_info, question = result['q_info'], result['question']
+    is_correct, correct_answer, user_answer = result['is_correct'], result['correct_answer'], result['user_answer']
+    with st.expander(f"문제 {i+1} (ID: {question['id']}): {'✅ 정답' if is_correct else '❌ 오답'}", expanded=not is_correct):
+        st.markdown(question['question'], unsafe_allow_html=True)
+        st.write("**정답:**", ", ".join(correct_answer))
+        st.write("**나의 답:**", ", ".join(user_answer) if user_answer else "선택 안 함")
+        
+        # 버튼 키는 표시 순서(i)가 아닌 문제 (ID, 유형)으로 만들어 페이지/토글이 바뀌어도 같은 위젯으로 유지됨
+        # 한 번 불러온 해설은 세션에 보관하여, 다른 버튼/확장 패널 조작으로 rerun되어도 다시 요청하지 않고 계속 표시
+        exp_key = (q_info['id'], q_info['type'])
+        explanation = shown_explanations.get(exp_key)
+        if explanation is None and st.button("🤖 AI 해설 보기", key=f"exp_{q_info['type']}_{q_info['id']}"):
+            # 새로 생성하는 경우 응답이 끝나기 전부터 도착한 부분을 자리표시자에 계속 갱신하여 보여줌
+            placeholder = st.empty()
+
+            def _show_partial(partial):
+                with placeholder.container():
+                    _render_explanation(partial)
+
+            with st.spinner("AI 튜터가 해설을 만들고 있어요..."):
+                explanation = get_ai_explanation_func(q_info['id'], q_info['type'], on_partial=_show_partial)
+            placeholder.empty()
+            error_msg = explanation.get('error') if explanation else "해설을 가져오지 못했습니다."
+            if error_msg:
+                st.error(error_msg)
+                explanation = None
+            else:
+                shown_explanations[exp_key] = explanation
+        if explanation:
+            _render_explanation({
+                'analogy': explanation.get('analogy', 'N/A'),
+                'visualization': explanation.get('visualization', 'N/A'),
+                'core_concepts': explanation.get('core_concepts', 'N/A'),
+            })
+
+def display_results(username: str, get_ai_explanation_func, get_ai_explanations_batch_func=None):
+    """
+    퀴즈 결과를 요약하고, 각 문제에 대한 상세 정보를 표시합니다.
+    get_ai_explanations_batch_func가 주어지면 오답 해설을 한 번에 생성하는 버튼을 함께 표시합니다.
+    채점 결과는 결과 화면 진입 시 한 번만 계산하므로, 새 퀴즈의 결과로 넘어갈 때 st.session_state.graded_results를 비워야 합니다.
+    (이미 펼쳐 본 해설을 담는 st.session_state.shown_explanations도 함께 비움)
+    """
     
-    total_questions = len(st.session_state.questions_to_solve)
+    st.header("📊 퀴즈 결과")
+    if 'graded_results' not in st.session_state:
+        _grade_quiz(username)
+    st.session_state.setdefault('shown_explanations', {})
+    wrong_q_infos = [r['q_info'] for r in st.session_state.graded_results if r['question'] and not r['is_correct']]
+
+    # 맞힌 문제는 기본으로 접혀 있어 대부분 열어보지 않으므로, 요청할 때만 카드(본문/버튼)를 그림
+    show_correct = False
+    if st.session_state.correct_count:
+        show_correct = st.toggle(f"✅ 맞힌 문제 {st.session_state.correct_count}개도 보기", key="results_show_correct")
+    
+    visible = [
+        (i, result) for i, result in enumerate(st.session_state.graded_results)
+        if not result['question'] or not result['is_correct'] or show_correct
+    ]
+    # 문제 수가 많으면 카드(확장 패널+버튼)를 한 페이지에 RESULTS_PAGE_SIZE개씩만 그림
+    page_count = max(1, -(-len(visible) // RESULTS_PAGE_SIZE))
+    page = 1
+    if page_count > 1:
+        # 토글로 표시 대상이 줄어 기존 페이지가 범위를 벗어나면 마지막 페이지로 맞춤 (위젯을 그리기 전에만 수정 가능)
+        if st.session_state.get("results_page", 1) > page_count:
+            st.session_state.results_page = page_count
+        page = st.number_input(f"페이지 (총 {page_count}쪽)", min_value=1, max_value=page_count, step=1, key="results_page")
+
+    for i, result in visible[(page - 1) * RESULTS_PAGE_SIZE : page * RESULTS_PAGE_SIZE]:
+        if not result['question']:
+            st.warning(f"결과 표시 중 문제(ID: {result['q_info']['id']})를 찾을 수 없습니다.")
+            continue
+        _render_result_card(i, result, get_ai_explanation_func)
+
+    if get_ai_explanations_batch_func and wrong_q_infos:
+        if st.button("🤖 오답 해설 한 번에 만들기", key="exp_all_wrong"):
+            failed = get_ai_explanations_batch_func(wrong_q_infos)
+            if failed:
+                st.warning(f"{failed}개 문제의 해설을 만들지 못했습니다. 각 문제의 'AI 해설 보기'로 다시 시도해주세요.")
+            else:
+                st.success("오답 해설을 모두 준비했습니다. 각 문제의 'AI 해설 보기'를 누르면 바로 표시됩니다.")
+
+    total_questions = len(st.session_state.graded_results)
+    correct_count = st.session_state.correct_count
     if total_questions > 0:
         score = (correct_count / total_questions) * 100
         st.title(f"총점: {score:.2f}점 ({correct_count}/{total_questions}개 정답)")
\ No newline at end of file